@@ -1,14 +1,18 @@
 from __future__ import print_function
 import piggyphoto
+from piggyphoto.autofocus import AutoFocus
 
 C = piggyphoto.Camera()
 print(C.abilities)
 
 
-# example: setting date manually
-cc = C.config
-af = cc.get_child_by_name("autofocusdrive")
-af.value = 1
-C.config = cc
+# example: triggering autofocus
+C.set_setting("autofocusdrive", 1)
+
+# example: contrast autofocus from the live view, through manualfocusdrive
+result = AutoFocus(C).run()
+print("moved %d units in %d frames" % (result.position, result.frames))
+for entry in result.trace:
+    print("%6d  step %d  %.4g" % entry)
 
 C.close()
@@ -0,0 +1,10 @@
+from __future__ import print_function
+from piggyphoto.pool import CameraPool
+
+with CameraPool() as pool:
+    print("%d cameras" % len(pool))
+    shots = pool.capture_all()
+    t0 = min(shot.time for shot in shots)
+    for shot in shots:
+        print("%-20s %-30s +%.1f ms  %s/%s" % (
+            shot.port, shot.model, 1000 * (shot.time - t0), shot.folder, shot.name))
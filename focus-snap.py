@@ -1,10 +1,10 @@
 import piggyphoto, pygame
+import io
 import os
 import time
-import Image, ImageFilter, ImageChops, ImageStat
 from collections import deque
 
-import focus
+from piggyphoto import focus
 
 def quit_pressed():
     for event in pygame.event.get():
@@ -12,17 +12,17 @@ def quit_pressed():
             return True
     return False
 
-def show(file):
-    picture = pygame.image.load(file)
+def show(file, namehint=""):
+    picture = pygame.image.load(file, namehint)
     picture = pygame.transform.scale(picture, (1056,704))
     main_surface.blit(picture, (0, 0))
     pygame.display.flip()
 
 C = piggyphoto.Camera()
 C.leave_locked()
-C.capture_preview('preview.jpg')
+frames = C.stream_previews()
 
-picture = pygame.image.load("preview.jpg")
+picture = pygame.image.load(io.BytesIO(next(frames)), "preview.jpg")
 pygame.display.set_mode(picture.get_size())
 main_surface = pygame.display.get_surface()
 
@@ -30,10 +30,11 @@ Q = deque()
 k = 1
 looking_for_peak = True
 
-while not quit_pressed():
-    C.capture_preview('preview.jpg')
-    show("preview.jpg")
-    f = focus.estimate("preview.jpg")
+for frame in frames:
+    if quit_pressed():
+        break
+    show(io.BytesIO(frame), "preview.jpg")
+    f = focus.estimate(frame)
     Q.append(f)
     if len(Q) > 20: 
         Q.popleft()
@@ -0,0 +1,20 @@
+from __future__ import print_function
+import os
+import sys
+import piggyphoto
+
+# python focus-stack.py [FRAMES] [STEP] [DEST]: focus bracket for stacking,
+# starting from the current focus and moving away from the camera
+n = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+step = int(sys.argv[2]) if len(sys.argv) > 2 else 2
+dest = sys.argv[3] if len(sys.argv) > 3 else "stack"
+if not os.path.isdir(dest):
+    os.makedirs(dest)
+
+C = piggyphoto.Camera()
+frames = C.focus_stack(n, step, dest)
+for frame in frames:
+    print("%3d  %5d  %8.4g  %s" % (frame.index, frame.position, frame.score, frame.path))
+if len(frames) < n:
+    print("end of the focus travel: %d of %d frames taken" % (len(frames), n))
+C.close()
@@ -0,0 +1,19 @@
+from __future__ import print_function
+import sys
+import piggyphoto
+
+# python import-card.py DEST [WORKERS]; run it again to resume
+dest = sys.argv[1]
+workers = int(sys.argv[2]) if len(sys.argv) > 2 else 2
+
+
+def progress(entry, done, total):
+    print("%5.1f%%  %s/%s" % (100.0 * done / max(total, 1), entry.folder, entry.name))
+
+C = piggyphoto.Camera()
+result = C.import_all(dest, workers=workers, progress=progress)
+print("%d downloaded (%.1f MB), %d already there, %d failed" % (
+    result.downloaded, result.bytes / 1e6, result.skipped, len(result.failed)))
+for entry, error in result.failed:
+    print("failed: %s/%s: %s" % (entry.folder, entry.name, error))
+C.close()
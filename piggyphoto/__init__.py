@@ -8,13 +8,17 @@ from __future__ import print_function
 # - libgphoto2 Python bindings by David PHAM-VAN <david@ab2r.com>
 # - ctypes_gphoto2.py by Hans Ulrich Niedermann <gp@n-dimensional.de>
 
-import sys
 import os
 import re
+import stat
 import ctypes
 import time
+import threading
+import contextlib
+from collections import namedtuple
 from ctypes import byref, util as ctype_util
 from . import ptp
+from .snapshot import ConfigSnapshot, WidgetSnapshot
 
 # Some functions return errors which can be fixed by retrying.
 # For example, capture_preview on Canon 550D fails the first
@@ -27,18 +31,74 @@ retries = 1
 # it locks the device.
 unmount_cmd = 'gvfs-mount -s gphoto2'
 
-libgphoto2dll = ctype_util.find_library("gphoto2")
+try:
+    xrange
+except NameError:
+    xrange = range
 
-if libgphoto2dll is None:
-    print("libgphoto2 library not found")
-    sys.exit(-1)
+# PIGGYPHOTO_BACKEND=sim replaces libgphoto2 with the simulated cameras of
+# piggyphoto.sim, e.g. for tests on machines without a camera. A single
+# Camera can also be given its own library with Camera(backend=...).
+backend = os.environ.get("PIGGYPHOTO_BACKEND", "libgphoto2")
 
-print("Loading libgphoto2 DLL: " + libgphoto2dll)
-gp = ctypes.CDLL(libgphoto2dll)
-# Needed to ensure context memory address is not truncated to 32 bits
-gp.gp_context_new.restype = ctypes.c_void_p
 
-context = ctypes.c_void_p(gp.gp_context_new())
+class _MissingLibrary(object):
+    """Stands in for libgphoto2 when it is not installed: cameras given a
+    backend still work, anything using the module-wide library raises."""
+
+    def __getattr__(self, name):
+        raise ImportError("libgphoto2 library not found (PIGGYPHOTO_BACKEND=sim simulates cameras)")
+
+
+if backend == "sim":
+    from .sim import SimulatedLibrary
+    libgphoto2dll = None
+    print("Using simulated libgphoto2")
+    gp = SimulatedLibrary()
+else:
+    libgphoto2dll = ctype_util.find_library("gphoto2")
+
+    if libgphoto2dll is None:
+        print("libgphoto2 library not found (PIGGYPHOTO_BACKEND=sim simulates cameras)")
+        gp = _MissingLibrary()
+    else:
+        print("Loading libgphoto2 DLL: " + libgphoto2dll)
+        # This must stay a CDLL and not a PyDLL: ctypes releases the GIL around every
+        # CDLL call, so other threads keep running during multi-second captures and
+        # downloads. For the same reason no Python callbacks (progress, idle, cancel)
+        # are installed on the contexts: libgphoto2 would have to take the GIL back
+        # for each of them. python -m piggyphoto.bench concurrency measures this.
+        gp = ctypes.CDLL(libgphoto2dll)
+# event data returned by gp_camera_wait_for_event is malloc()ed by libgphoto2
+libc = ctypes.CDLL(ctype_util.find_library("c"))
+
+
+def new_context(backend=None):
+    """Returns a new GPContext, e.g. for a Camera used from its own thread."""
+    lib = backend if backend is not None else gp
+    # Needed to ensure context memory address is not truncated to 32 bits
+    lib.gp_context_new.restype = ctypes.c_void_p
+    return ctypes.c_void_p(lib.gp_context_new())
+
+
+# Threads: libgphoto2 objects are not thread-safe, so a Camera (and the
+# files and widgets obtained from it) must only be used by one thread at a
+# time; hold Camera.lock when sharing one. Each Camera owns its own GPContext,
+# so different cameras can be driven from different threads in parallel.
+# This module-wide context is only used by objects not tied to a Camera,
+# such as CameraList(autodetect=True). Without libgphoto2 it is NULL, which
+# libgphoto2 accepts as well.
+context = ctypes.c_void_p() if isinstance(gp, _MissingLibrary) else new_context()
+
+
+def _default_context():
+    # the context argument of Camera, CameraFile and CameraList shadows this
+    return context
+
+
+def _free_function(lib):
+    # libgphoto2 malloc()s event data; other backends provide their own free()
+    return libc.free if isinstance(lib, ctypes.CDLL) else lib.free
 
 
 def library_version(verbose=True):
@@ -52,9 +112,13 @@ def library_version(verbose=True):
     for s in arrText:
         if s is None:
             break
-        v += '%s\n' % s
+        v += '%s\n' % s.decode("utf-8")
     return v
 
+
+def _version_tuple(version):
+    return tuple(int(x) for x in re.findall(r'\d+', version)[:3])
+
 # ctypes.c_char_p = c_char_p
 
 
@@ -73,6 +137,67 @@ class CameraFilePath(ctypes.Structure):
 class CameraText(ctypes.Structure):
     _fields_ = [('text', (ctypes.c_char * (32 * 1024)))]
 
+
+_time_t = getattr(ctypes, 'c_time_t', ctypes.c_long)
+
+
+class CameraFileInfoPreview(ctypes.Structure):
+    _fields_ = [('fields', ctypes.c_int),
+                ('status', ctypes.c_int),
+                ('size', ctypes.c_uint64),
+                ('type', (ctypes.c_char * 64)),
+                ('width', ctypes.c_uint32),
+                ('height', ctypes.c_uint32)]
+
+
+class CameraFileInfoFile(ctypes.Structure):
+    _fields_ = [('fields', ctypes.c_int),
+                ('status', ctypes.c_int),
+                ('size', ctypes.c_uint64),
+                ('type', (ctypes.c_char * 64)),
+                ('width', ctypes.c_uint32),
+                ('height', ctypes.c_uint32),
+                ('permissions', ctypes.c_int),
+                ('mtime', _time_t)]
+
+
+class CameraFileInfoAudio(ctypes.Structure):
+    _fields_ = [('fields', ctypes.c_int),
+                ('status', ctypes.c_int),
+                ('size', ctypes.c_uint64),
+                ('type', (ctypes.c_char * 64))]
+
+
+class CameraFileInfo(ctypes.Structure):
+    """ From 'gphoto2-filesys.h' (libgphoto2 2.5)
+    typedef struct {
+            CameraFileInfoPreview preview;
+            CameraFileInfoFile    file;
+            CameraFileInfoAudio   audio;
+    } CameraFileInfo;
+    """
+    _fields_ = [('preview', CameraFileInfoPreview),
+                ('file', CameraFileInfoFile),
+                ('audio', CameraFileInfoAudio)]
+
+
+_handler_size_func = ctypes.CFUNCTYPE(ctypes.c_int, ctypes.c_void_p, ctypes.POINTER(ctypes.c_uint64))
+_handler_rw_func = ctypes.CFUNCTYPE(ctypes.c_int, ctypes.c_void_p, ctypes.POINTER(ctypes.c_ubyte),
+                                    ctypes.POINTER(ctypes.c_uint64))
+
+
+class CameraFileHandler(ctypes.Structure):
+    """ From 'gphoto2-file.h' (libgphoto2 >= 2.5.10)
+    typedef struct _CameraFileHandler {
+            int (*size) (void*priv, uint64_t *size);
+            int (*read) (void*priv, unsigned char *data, uint64_t *len);
+            int (*write) (void*priv, unsigned char *data, uint64_t *len);
+    } CameraFileHandler;
+    """
+    _fields_ = [('size', _handler_size_func),
+                ('read', _handler_rw_func),
+                ('write', _handler_rw_func)]
+
 # cdef extern from "gphoto2/gphoto2-port-version.h":
 #  ctypedef enum GPVersionVerbosity:
 GP_VERSION_SHORT = 0
@@ -139,9 +264,10 @@ class _CameraAbilities(ctypes.Structure):
                 ('reserved7', ctypes.c_int),
                 ('reserved8', ctypes.c_int)]
 
-# the GPPortInfo data structure is a pointer in SVN
-# in stable versions, it is a struct
-if library_version().split('\n')[0] == '2.4.99':
+# the GPPortInfo data structure is a pointer since 2.4.99 (2.5 development)
+# in older stable versions, it is a struct. Without libgphoto2 only other
+# backends can be used, which follow 2.5.
+if isinstance(gp, _MissingLibrary) or _version_tuple(library_version().split('\n')[0]) >= (2, 4, 99):
     class PortInfo(ctypes.c_void_p):
         pass
 else:
@@ -156,10 +282,46 @@ else:
 # gphoto constants
 # Defined in 'gphoto2-port-result.h'
 GP_OK = 0
+GP_ERROR = -1
+GP_ERROR_NOT_SUPPORTED = -6
+GP_ERROR_IO = -7
+GP_ERROR_TIMEOUT = -10
+# the port errors, GP_ERROR_IO_SUPPORTED_SERIAL (-20) to GP_ERROR_IO_LOCK (-60)
+GP_ERROR_IO_LAST = -60
+GP_ERROR_CORRUPTED_DATA = -102
+GP_ERROR_CAMERA_BUSY = -110
 # CameraCaptureType enum in 'gphoto2-camera.h'
 GP_CAPTURE_IMAGE = 0
 # CameraFileType enum in 'gphoto2-file.h'
 GP_FILE_TYPE_NORMAL = 1
+# CameraFileInfoFields in 'gphoto2-filesys.h'
+GP_FILE_INFO_NONE = 0
+GP_FILE_INFO_TYPE = 1 << 0
+GP_FILE_INFO_SIZE = 1 << 2
+GP_FILE_INFO_WIDTH = 1 << 3
+GP_FILE_INFO_HEIGHT = 1 << 4
+GP_FILE_INFO_PERMISSIONS = 1 << 5
+GP_FILE_INFO_STATUS = 1 << 6
+GP_FILE_INFO_MTIME = 1 << 7
+
+# Camera.file_info(); fields the camera did not report are None
+FileInfo = namedtuple('FileInfo', ['size', 'mtime', 'type', 'width', 'height'])
+
+
+# CameraEventType enum in 'gphoto2-camera.h'
+GP_EVENT_UNKNOWN = 0
+GP_EVENT_TIMEOUT = 1
+GP_EVENT_FILE_ADDED = 2
+GP_EVENT_FOLDER_ADDED = 3
+GP_EVENT_CAPTURE_COMPLETE = 4
+GP_EVENT_FILE_CHANGED = 5
+event_types = ['Unknown', 'Timeout', 'FileAdded', 'FolderAdded', 'CaptureComplete', 'FileChanged']
+# GP_EVENT_UNKNOWN text of the ptp2 driver for a changed property; newer
+# versions name the config widget and give its new value
+_PROPERTY_EVENT = re.compile(r'PTP Property ([0-9a-fA-F]+) changed(?:, "([^"]*)" to "([^"]*)")?')
+
+# settings that change on their own, left out by Camera.watch_config()
+VOLATILE_SETTINGS = ('datetime',)
 
 
 GP_WIDGET_WINDOW = 0   # Window widget This is the toplevel configuration widget. It should likely contain multiple GP_WIDGET_SECTION entries.
@@ -207,28 +369,80 @@ class libgphoto2error(Exception):
         return "%s (%s)" % (self.message, self.result)
 
 
-def _check_result(result):
+def _check_result(result, backend=None):
+    """Raises a libgphoto2error for a negative result, with the message of
+    backend (the library that returned it, by default the module-wide one)."""
     if result < 0:
-        gp.gp_result_as_string.restype = ctypes.c_char_p
-        message = gp.gp_result_as_string(result)
-        raise libgphoto2error(result, message)
+        raise libgphoto2error(result, _result_message(result, backend))
     return result
 
 
+def _result_message(result, backend=None):
+    lib = backend if backend is not None else gp
+    lib.gp_result_as_string.restype = ctypes.c_char_p
+    return lib.gp_result_as_string(result).decode("utf-8")
+
+
+def _port_error(result):
+    # I/O and port results: the camera is not (or no longer) where it was
+    return result == GP_ERROR_IO or GP_ERROR_IO_LAST <= result <= -20
+
+
+def _cstr(s):
+    """Encodes s for passing as a char* (ctypes passes str as wchar_t* on Python 3)."""
+    if isinstance(s, bytes):
+        return s
+    return str(s).encode("utf-8")
+
+
 def _check_unref(result, camfile):
     if result != 0:
-        gp.gp_file_unref(camfile._cf)
-        gp.gp_result_as_string.restype = ctypes.c_char_p
-        message = gp.gp_result_as_string(result)
-        raise libgphoto2error(result, message)
+        camfile._gp.gp_file_unref(camfile._cf)
+        camfile._cf = ctypes.c_void_p()
+        raise libgphoto2error(result, _result_message(result, camfile._gp))
+
+
+_clock = getattr(time, 'monotonic', time.time)
 
 
 class Camera(object):
-    def __init__(self, auto_init=True):
+    # Seconds for which Camera.config returns the same tree instead of
+    # fetching it again from the camera. 0 disables the cache.
+    config_ttl = 0
+
+    def __init__(self, auto_init=True, config_ttl=None, port=None, model=None, context=None,
+                 backend=None):
+        """Opens the first camera found, or the one at port (e.g. "usb:001,007",
+        see CameraList(autodetect=True)), whose model should then be given too.
+        A new GPContext is created for the camera unless one is given.
+        backend replaces the module-wide libgphoto2, see piggyphoto.sim.
+        """
         self._cam = ctypes.c_void_p()
+        self._gp = backend if backend is not None else gp
+        self._own_context = context is None
+        self._context = context if context is not None else new_context(self._gp)
+        self.port = port
+        self.model = model
         self._leave_locked = False
-        _check_result(gp.gp_camera_new(byref(self._cam)))
+        if config_ttl is not None:
+            self.config_ttl = config_ttl
+        self._config_cache = None
+        self._config_time = 0
+        self.config_cache_hits = 0
+        self.config_cache_misses = 0
+        self._fs = None
+        # serializes access to the camera between threads, see CapturePipeline
+        self.lock = threading.RLock()
+        _check_result(self._gp.gp_camera_new(byref(self._cam)), self._gp)
         self.initialized = False
+        if model is not None:
+            al = CameraAbilitiesList(self._gp)
+            ab = CameraAbilities()
+            al.get_abilities(al.lookup_model(_cstr(model)), ab)
+            self.abilities = ab
+        if port is not None:
+            il = PortInfoList(self._gp)
+            self.port_info = il.get_info(il.lookup_path(_cstr(port)))
         if auto_init:
             self.init()
 
@@ -237,7 +451,7 @@ class Camera(object):
             print("Camera is already initialized.")
         ans = 0
         for i in xrange(1 + retries):
-            ans = gp.gp_camera_init(self._cam, context)
+            ans = self._gp.gp_camera_init(self._cam, self._context)
             if ans == 0:
                 break
             elif ans == -60:
@@ -245,17 +459,46 @@ class Camera(object):
                 os.system(unmount_cmd)
                 time.sleep(1)
                 print("Camera.init() retry #%d..." % (i))
-        _check_result(ans)
+        _check_result(ans, self._gp)
         self.initialized = True
 
     def reinit(self):
-        self.close()
-        self.__new__()
-        self.init()
+        """Reconnects to the camera, e.g. after it was unplugged or went to sleep.
+
+        A camera opened on a given port gets a new one when it is plugged
+        back in (the USB device number changes). If the old port fails, the
+        camera is looked up again by model, provided only one camera of that
+        model is attached.
+        """
+        if self.initialized:
+            # the old connection may already be gone
+            self._gp.gp_camera_exit(self._cam, self._context)
+            self.initialized = False
+        self.invalidate_config()
+        try:
+            self.init()
+        except libgphoto2error as e:
+            if self.port is None or self.model is None or not _port_error(e.result) \
+                    or not self._relocate():
+                raise
+            self.init()
+
+    def _relocate(self):
+        # moves to the port the camera's model is now detected on
+        ports = [port for model, port in CameraList(True, self._context, self._gp).toList()
+                 if model == self.model]
+        if len(ports) != 1 or ports[0] == self.port:
+            return False
+        PortInfoList.reload(self._gp)
+        il = PortInfoList(self._gp)
+        self.port_info = il.get_info(il.lookup_path(_cstr(ports[0])))
+        self.port = ports[0]
+        return True
 
     def __del__(self):
         # not sure about this one - why would you use it
-        if not self._leave_locked:
+        # (_leave_locked is missing if __init__ failed before setting it)
+        if not getattr(self, '_leave_locked', True):
             self.close()
 
     def __enter__(self):
@@ -268,62 +511,221 @@ class Camera(object):
         self._leave_locked = True
 
     def ref(self):
-        _check_result(gp.gp_camera_ref(self._cam))
+        _check_result(self._gp.gp_camera_ref(self._cam), self._gp)
 
     def unref(self):
-        _check_result(gp.gp_camera_unref(self._cam))
+        _check_result(self._gp.gp_camera_unref(self._cam), self._gp)
 
     def _exit(self):
-        _check_result(gp.gp_camera_exit(self._cam, context))
+        _check_result(self._gp.gp_camera_exit(self._cam, self._context), self._gp)
 
     def _free(self):
-        _check_result(gp.gp_camera_free(self._cam))
+        _check_result(self._gp.gp_camera_free(self._cam), self._gp)
 
     def close(self):
         if self.initialized:
             self._exit()
             self._free()
             self.initialized = False
+        if self._own_context:
+            self._gp.gp_context_unref(self._context)
+            self._own_context = False
 
     @property
     def summary(self):
         txt = CameraText()
-        _check_result(gp.gp_camera_get_summary(self._cam, byref(txt), context))
+        _check_result(self._gp.gp_camera_get_summary(self._cam, byref(txt), self._context), self._gp)
         return txt.text.decode("utf-8")
 
     @property
     def manual(self):
         # TODO: CHECK FOR ERROR ON CALL
         txt = CameraText()
-        _check_result(gp.gp_camera_get_manual(self._cam, byref(txt), context))
+        _check_result(self._gp.gp_camera_get_manual(self._cam, byref(txt), self._context), self._gp)
         return txt.text.decode("utf-8")
 
     @property
     def about(self):
         txt = CameraText()
-        _check_result(gp.gp_camera_get_about(self._cam, byref(txt), context))
+        _check_result(self._gp.gp_camera_get_about(self._cam, byref(txt), self._context), self._gp)
         return txt.text.decode("utf-8")
 
     @property
     def abilities(self):
         ab = CameraAbilities()
-        _check_result(gp.gp_camera_get_abilities(self._cam, byref(ab._ab)))
+        _check_result(self._gp.gp_camera_get_abilities(self._cam, byref(ab._ab)), self._gp)
         return ab
 
     @abilities.setter
     def abilities(self, ab):
-        _check_result(gp.gp_camera_set_abilities(self._cam, ab._ab))
+        _check_result(self._gp.gp_camera_set_abilities(self._cam, ab._ab), self._gp)
 
     @property
     def config(self):
-        window = CameraWidget(GP_WIDGET_WINDOW)
-        _check_result(gp.gp_camera_get_config(self._cam, byref(window._w), context))
-        window.populate_children()
+        """The configuration tree, cached for config_ttl seconds. Setting a
+        value on it drops it from the cache until it is assigned back."""
+        window = self._fresh_config()
+        if window is not None:
+            return window
+        self.config_cache_misses += 1
+        window = CameraWidget(GP_WIDGET_WINDOW, backend=self._gp)
+        _check_result(self._gp.gp_camera_get_config(self._cam, byref(window._w), self._context), self._gp)
+        self._config_cache = window
+        self._config_time = _clock()
         return window
 
     @config.setter
     def config(self, window):
-        _check_result(gp.gp_camera_set_config(self._cam, window._w, context))
+        self.invalidate_config()
+        _check_result(self._gp.gp_camera_set_config(self._cam, window._w, self._context), self._gp)
+
+    def get_setting(self, name):
+        """Returns the value of the config widget called name.
+
+        Uses gp_camera_get_single_config() when the library has it, so only
+        that one setting is read from the camera, unless a cached tree is
+        still fresh (see config_ttl).
+        """
+        window = self._fresh_config()
+        if window is None and hasattr(self._gp, 'gp_camera_get_single_config'):
+            w = self._get_single_config(name)
+            try:
+                return w.value
+            finally:
+                self._gp.gp_widget_free(w._w)
+        if window is None:
+            window = self.config
+        return window.get_child_by_name(name).value
+
+    def set_setting(self, name, value):
+        """Sets the config widget called name to value, with
+        gp_camera_set_single_config() when the library has it."""
+        if hasattr(self._gp, 'gp_camera_set_single_config'):
+            self.invalidate_config()
+            w = self._get_single_config(name)
+            try:
+                w.value = value
+                _check_result(self._gp.gp_camera_set_single_config(self._cam, _cstr(name), w._w, self._context), self._gp)
+            finally:
+                self._gp.gp_widget_free(w._w)
+        else:
+            window = self.config
+            window.get_child_by_name(name).value = value
+            self.config = window
+
+    def _get_single_config(self, name):
+        w = CameraWidget(backend=self._gp)
+        _check_result(self._gp.gp_camera_get_single_config(self._cam, _cstr(name), byref(w._w), self._context), self._gp)
+        return w
+
+    def _fresh_config(self):
+        if self._config_cache is not None and self._config_cache._edited:
+            # values set on the cached tree but not (yet) sent to the camera
+            # must not show up as the camera's
+            self.invalidate_config()
+        if self._config_cache is not None and _clock() - self._config_time < self.config_ttl:
+            self.config_cache_hits += 1
+            return self._config_cache
+        return None
+
+    def config_snapshot(self):
+        """Returns a ConfigSnapshot of the whole configuration tree, as
+        currently set on the camera (the cached tree is refreshed)."""
+        self.invalidate_config()
+        return self.config.snapshot()
+
+    def config_diff(self, previous):
+        """Returns ({path: (old value, new value)}, snapshot) for the settings
+        that changed since the ConfigSnapshot previous was taken."""
+        current = self.config_snapshot()
+        return previous.diff(current), current
+
+    def watch_config(self, interval=1.0, previous=None, events=True, ignore=VOLATILE_SETTINGS,
+                     poll=10.0):
+        """Yields (changes, snapshot) whenever a setting changed, see
+        config_diff(). Settings whose name or path is in ignore are left out.
+
+        The whole tree is read once. With events, the camera's property change
+        events (see wait_for_event()) then tell which setting to re-read with
+        get_setting(), so an idle camera costs one gp_camera_wait_for_event()
+        every interval seconds; the other events are consumed. An event that
+        does not name the setting re-reads the whole tree, and so does a poll
+        every poll seconds (None: never), which catches the changes a driver
+        reports no event for. Without events, or when the driver has none,
+        the whole tree is polled every interval seconds.
+        """
+        if previous is None:
+            previous = self.config_snapshot()
+        read_time = _clock()
+        ignore = frozenset(ignore or ())
+        while True:
+            name = None
+            if events:
+                try:
+                    event = self.wait_for_event(interval * 1000)
+                except libgphoto2error as e:
+                    if e.result != GP_ERROR_NOT_SUPPORTED:
+                        raise
+                    events = False
+                    continue
+                match = _PROPERTY_EVENT.match(event.data or "") if event.type == GP_EVENT_UNKNOWN else None
+                if match is not None and match.group(2) not in ignore:
+                    name = match.group(2)
+                elif poll is None or _clock() - read_time < poll:
+                    continue
+            else:
+                time.sleep(interval)
+            if name is not None and name in previous:
+                w = previous[name]
+                value = self.get_setting(name)
+                changes = {w.path: (w.value, value)} if value != w.value else {}
+                current = previous.updated({w.path: value})
+            else:
+                changes, current = self.config_diff(previous)
+                read_time = _clock()
+            changes = dict((path, change) for path, change in changes.items()
+                           if path not in ignore and path.rsplit(".", 1)[-1] not in ignore)
+            previous = current
+            if changes:
+                yield changes, current
+
+    @contextlib.contextmanager
+    def config_batch(self):
+        """Changes several settings at once:
+
+            with cam.config_batch() as cfg:
+                cfg.iso = "400"
+                cfg.aperture = "8"
+
+        Only widgets whose value actually changed are committed when the block
+        exits, with a single gp_camera_set_single_config() or
+        gp_camera_set_config() call. Nothing is written if the block raises.
+        """
+        window = self.config
+        window._dirty = {}
+        try:
+            yield window
+            # gp_widget_changed() clears the flag, so set it again for the commit
+            changed = [w for w in window._dirty.values() if w.changed]
+            for w in changed:
+                w.changed = True
+        finally:
+            window._dirty = None
+            self.invalidate_config()
+        self._commit_config(window, changed)
+
+    def _commit_config(self, window, changed):
+        if not changed:
+            return
+        if len(changed) == 1 and hasattr(self._gp, 'gp_camera_set_single_config'):
+            w = changed[0]
+            _check_result(self._gp.gp_camera_set_single_config(self._cam, _cstr(w.name), w._w, self._context), self._gp)
+        else:
+            _check_result(self._gp.gp_camera_set_config(self._cam, window._w, self._context), self._gp)
+
+    def invalidate_config(self):
+        """Drops the cached config tree; the next Camera.config refetches it."""
+        self._config_cache = None
 
     @property
     def port_info(self):
@@ -331,63 +733,237 @@ class Camera(object):
 
     @port_info.setter
     def port_info(self, info):
-        _check_result(gp.gp_camera_set_port_info(self._cam, info))
+        _check_result(self._gp.gp_camera_set_port_info(self._cam, info), self._gp)
 
     def capture_image(self, destpath=None):
         path = CameraFilePath()
 
         ans = 0
         for i in xrange(1 + retries):
-            ans = gp.gp_camera_capture(self._cam, GP_CAPTURE_IMAGE, byref(path), context)
+            ans = self._gp.gp_camera_capture(self._cam, GP_CAPTURE_IMAGE, byref(path), self._context)
             if ans == 0:
                 break
             else:
                 print("capture_image(%s) retry #%d..." % (destpath, i))
-        _check_result(ans)
+        # the camera may have changed settings on its own (auto exposure)
+        self.invalidate_config()
+        _check_result(ans, self._gp)
 
+        folder, name = path.folder.decode("utf-8"), path.name.decode("utf-8")
+        if self._fs is not None:
+            self._fs.add(folder, name)
         if destpath:
-            self.download_file(path.folder, path.name, destpath)
+            self.download_file(folder, name, destpath)
         else:
-            return (path.folder, path.name)
+            return (folder, name)
 
     def capture_preview(self, destpath=None):
         """
         Note: ALWAYS use cfile.unref() after usage
         """
-        cfile = CameraFile()
+        cfile = CameraFile(backend=self._gp)
+        self._capture_preview(cfile, destpath)
+
+        if destpath:
+            cfile.save(destpath)
+        return cfile
 
+    def _capture_preview(self, cfile, destpath=None):
         ans = 0
         for i in xrange(1 + retries):
-            ans = gp.gp_camera_capture_preview(self._cam, cfile._cf, context)
+            ans = self._gp.gp_camera_capture_preview(self._cam, cfile._cf, self._context)
             if ans == 0:
                 break
             else:
                 print("capture_preview(%s) retry #%d..." % (destpath, i))
-        _check_result(ans)
+        _check_result(ans, self._gp)
 
-        if destpath:
-            cfile.save(destpath)
-        return cfile
+    def stream_previews(self):
+        """Yields live view frames as memoryviews, without touching the disk.
+
+        The frames point straight into the buffer of a single CameraFile that
+        is reused for the whole stream, so a frame is only valid until the
+        next one is requested. Use bytes(frame) to keep a copy. The last frame
+        stays valid when the stream is closed, e.g. by breaking out of a loop.
+        """
+        cfile = CameraFile(backend=self._gp)
+        while True:
+            self._capture_preview(cfile)
+            buf = cfile._buffer()
+            # holds the file, as buffer() does, for when the generator is closed
+            buf._ref = _FileRef(cfile._cf, self._gp)
+            frame = memoryview(buf)
+            yield frame
+            if hasattr(frame, 'release'):
+                # stale frames raise ValueError instead of reading freed memory
+                try:
+                    frame.release()
+                except BufferError:
+                    pass
 
-    def download_file(self, srcfolder, srcfilename, destpath):
-        cfile = CameraFile(self._cam, srcfolder, srcfilename)
-        cfile.save(destpath)
-        gp.gp_file_unref(cfile._cf)
+    def process_previews(self, callback):
+        """Callback form of stream_previews(): callback(frame) is called for
+        every live view frame until it returns False.
+        """
+        for frame in self.stream_previews():
+            if callback(frame) is False:
+                break
+
+    def get_file(self, srcfolder, srcfilename):
+        """Downloads a file into memory and returns it as a CameraFile."""
+        return CameraFile(self._cam, srcfolder, srcfilename, self._context, self._gp)
+
+    def download_file(self, srcfolder, srcfilename, destpath, direct=False, preallocate=True):
+        """Downloads a file to destpath.
+
+        With direct=True, libgphoto2 writes the file itself to a descriptor
+        opened on destpath (gp_file_new_from_fd) instead of building it in
+        memory first. preallocate then reserves the size reported by
+        file_info() up front with posix_fallocate(), where available, which
+        keeps large files unfragmented. The data goes to destpath + ".part",
+        renamed over destpath once complete, so a failed direct download
+        leaves whatever was at destpath alone.
+        """
+        if not direct or not hasattr(self._gp, 'gp_file_new_from_fd'):
+            cfile = self.get_file(srcfolder, srcfilename)
+            cfile.save(destpath)
+            return
+        part = destpath + ".part"
+        fd = os.open(part, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666)
+        try:
+            if preallocate and hasattr(os, 'posix_fallocate'):
+                try:
+                    size = self.file_info(srcfolder, srcfilename).size
+                except libgphoto2error:
+                    size = None
+                if size:
+                    os.posix_fallocate(fd, 0, size)
+            self._download_fd(fd, srcfolder, srcfilename)
+            # drop whatever was preallocated beyond the actual data
+            os.ftruncate(fd, os.lseek(fd, 0, os.SEEK_CUR))
+        except BaseException:
+            os.close(fd)
+            os.unlink(part)
+            raise
+        os.close(fd)
+        os.rename(part, destpath)
+
+    def _download_fd(self, fd, srcfolder, srcfilename):
+        # the CameraFile closes the descriptor it is given, so it gets a
+        # duplicate sharing the file offset with fd
+        CameraFile(self._cam, srcfolder, srcfilename, self._context, self._gp, fd=os.dup(fd))
+
+    def download_to(self, fileobj, srcfolder, srcfilename, chunk_size=1024 * 1024):
+        """Streams a file into fileobj, anything with a write() method (a
+        file, a socket's makefile('wb'), a hashing wrapper, ...), and returns
+        the number of bytes written.
+
+        With libgphoto2 >= 2.5.10 the data is handed to fileobj.write() chunk
+        by chunk as it arrives from the camera, so memory use does not grow
+        with the file size. Older libraries download the whole file first and
+        write it out in chunks of chunk_size.
+        """
+        if not hasattr(self._gp, 'gp_file_new_from_handler'):
+            fd = _regular_fd(fileobj) if hasattr(self._gp, 'gp_file_new_from_fd') else None
+            if fd is not None:
+                fileobj.flush()
+                start = os.lseek(fd, 0, os.SEEK_CUR)
+                self._download_fd(fd, srcfolder, srcfilename)
+                return os.lseek(fd, 0, os.SEEK_CUR) - start
+            buf = self.get_file(srcfolder, srcfilename).buffer()
+            for i in xrange(0, len(buf), chunk_size):
+                _write_all(fileobj, buf[i:i + chunk_size])
+            return len(buf)
+        writer = _StreamWriter(fileobj)
+        try:
+            CameraFile(self._cam, srcfolder, srcfilename, self._context, self._gp, handler=writer)
+        except libgphoto2error:
+            # an exception in fileobj.write() aborts the transfer with GP_ERROR
+            if writer.error is not None:
+                raise writer.error
+            raise
+        return writer.written
+
+    def import_all(self, dest, workers=1, **kwargs):
+        """Downloads every file on the camera below dest and returns an
+        ImportResult; see piggyphoto.importer for the options."""
+        from .importer import Importer
+        return Importer(self, dest, workers, **kwargs).run()
+
+    def focus_stack(self, n_steps, step_size=1, destdir=".", **kwargs):
+        """Shoots a focus bracket of n_steps frames into destdir and returns
+        the list of StackFrames; see piggyphoto.focusstack."""
+        from .focusstack import focus_stack
+        return focus_stack(self, n_steps, step_size, destdir, **kwargs)
+
+    def pipeline(self, queue_size=4):
+        """Returns a CapturePipeline that downloads shots in the background."""
+        from .pipeline import CapturePipeline
+        return CapturePipeline(self, queue_size)
 
     def trigger_capture(self):
-        _check_result(gp.gp_camera_trigger_capture(self._cam, context))
+        self.invalidate_config()
+        _check_result(self._gp.gp_camera_trigger_capture(self._cam, self._context), self._gp)
 
-    def wait_for_event(self, timeout):
-        raise NotImplementedError
+    def wait_for_event(self, timeout=1000):
+        """Waits up to timeout milliseconds for the camera to report something.
+        Returns a CameraEvent, whose type is GP_EVENT_TIMEOUT if nothing happened.
+        """
+        evtype = ctypes.c_int()
+        data = ctypes.c_void_p()
+        _check_result(self._gp.gp_camera_wait_for_event(
+            self._cam, int(timeout), byref(evtype), byref(data), self._context), self._gp)
+        if evtype.value != GP_EVENT_TIMEOUT:
+            self.invalidate_config()
+        event = CameraEvent._from_result(evtype.value, data, _free_function(self._gp))
+        if self._fs is not None:
+            self._fs.update(event)
+        return event
+
+    def events(self, timeout=1000, timeouts=False):
+        """Yields CameraEvents as the camera reports them, e.g.
+
+            for event in cam.events():
+                if event.type == GP_EVENT_FILE_ADDED:
+                    cam.download_file(event.folder, event.name, event.name)
+
+        Timeout events are only yielded if timeouts is True, which gives the
+        loop a chance to stop while the camera is idle.
+        """
+        while True:
+            event = self.wait_for_event(timeout)
+            if timeouts or event.type != GP_EVENT_TIMEOUT:
+                yield event
+
+    def file_info(self, folder, name):
+        """Returns the FileInfo of a file on the camera, without downloading it."""
+        info = CameraFileInfo()
+        _check_result(self._gp.gp_camera_file_get_info(
+            self._cam, _cstr(folder), _cstr(name), byref(info), self._context), self._gp)
+        f = info.file
+        return FileInfo(
+            f.size if f.fields & GP_FILE_INFO_SIZE else None,
+            f.mtime if f.fields & GP_FILE_INFO_MTIME else None,
+            f.type.decode("utf-8") if f.fields & GP_FILE_INFO_TYPE else None,
+            f.width if f.fields & GP_FILE_INFO_WIDTH else None,
+            f.height if f.fields & GP_FILE_INFO_HEIGHT else None)
+
+    @property
+    def fs(self):
+        """CameraFS index of the files on the camera, created on first use."""
+        if self._fs is None:
+            from .camerafs import CameraFS
+            self._fs = CameraFS(self)
+        return self._fs
 
     def list_folders(self, path="/"):
-        l = CameraList()
-        _check_result(gp.gp_camera_folder_list_folders(self._cam, str(path), l._l, context))
+        l = CameraList(backend=self._gp)
+        _check_result(self._gp.gp_camera_folder_list_folders(self._cam, _cstr(path), l._l, self._context), self._gp)
         return l.toList()
 
     def list_files(self, path="/"):
-        l = CameraList()
-        _check_result(gp.gp_camera_folder_list_files(self._cam, str(path), l._l, context))
+        l = CameraList(backend=self._gp)
+        _check_result(self._gp.gp_camera_folder_list_files(self._cam, _cstr(path), l._l, self._context), self._gp)
         return l.toList()
 
     def _list_config(self, widget, cfglist, path):
@@ -407,113 +983,254 @@ class Camera(object):
 
     def ptp_canon_eos_requestdevicepropvalue(self, prop):
         params = ctypes.c_void_p(self._cam.value + 12)
-        gp.ptp_generic_no_data(params, ptp.PTP_OC_CANON_EOS_RequestDevicePropValue, 1, prop)
+        self._gp.ptp_generic_no_data(params, ptp.PTP_OC_CANON_EOS_RequestDevicePropValue, 1, prop)
 
     # TODO: port_speed, init, config
 
 
+class CameraEvent(object):
+    """An event returned by Camera.wait_for_event().
+
+    For GP_EVENT_FILE_ADDED, GP_EVENT_FOLDER_ADDED and GP_EVENT_FILE_CHANGED,
+    folder and name tell where; for GP_EVENT_UNKNOWN, data holds the text
+    reported by the driver.
+    """
+
+    def __init__(self, type, folder=None, name=None, data=None):
+        self.type = type
+        self.folder = folder
+        self.name = name
+        self.data = data
+
+    @classmethod
+    def _from_result(cls, evtype, data, free):
+        event = cls(evtype)
+        if data.value:
+            if evtype in (GP_EVENT_FILE_ADDED, GP_EVENT_FOLDER_ADDED, GP_EVENT_FILE_CHANGED):
+                path = ctypes.cast(data, ctypes.POINTER(CameraFilePath)).contents
+                event.folder = path.folder.decode("utf-8")
+                event.name = path.name.decode("utf-8")
+            elif evtype == GP_EVENT_UNKNOWN:
+                event.data = ctypes.cast(data, ctypes.c_char_p).value.decode("utf-8", "replace")
+            free(data)
+        return event
+
+    @property
+    def typestr(self):
+        return event_types[self.type]
+
+    def __repr__(self):
+        if self.name is not None:
+            return "%s:%s/%s" % (self.typestr, self.folder, self.name)
+        elif self.data is not None:
+            return "%s:%s" % (self.typestr, self.data)
+        return self.typestr
+
+
 class CameraFile(object):
-    def __init__(self, cam=None, srcfolder=None, srcfilename=None):
+    def __init__(self, cam=None, srcfolder=None, srcfilename=None, context=None, backend=None,
+                 handler=None, fd=None):
+        """Downloads srcfolder/srcfilename from cam, if given. With a
+        handler (see Camera.download_to()) the data is passed on to it, with
+        a file descriptor fd libgphoto2 writes it there itself; either way it
+        is not kept in memory. The CameraFile takes ownership of fd."""
+        self._gp = backend if backend is not None else gp
         self._cf = ctypes.c_void_p()
-        _check_result(gp.gp_file_new(byref(self._cf)))
+        if handler is not None:
+            self._handler = handler
+            _check_result(self._gp.gp_file_new_from_handler(byref(self._cf), byref(handler.struct), None), self._gp)
+        elif fd is not None:
+            result = self._gp.gp_file_new_from_fd(byref(self._cf), fd)
+            if result < 0:
+                os.close(fd)
+            _check_result(result, self._gp)
+        else:
+            _check_result(self._gp.gp_file_new(byref(self._cf)), self._gp)
         if cam:
-            _check_unref(gp.gp_camera_file_get(
-                cam, srcfolder, srcfilename, GP_FILE_TYPE_NORMAL, self._cf, context), self)
+            if context is None:
+                context = _default_context()
+            _check_unref(self._gp.gp_camera_file_get(
+                cam, _cstr(srcfolder), _cstr(srcfilename), GP_FILE_TYPE_NORMAL, self._cf, context), self)
 
     def open(self, filename):
-        _check_result(gp.gp_file_open(byref(self._cf), filename))
+        _check_result(self._gp.gp_file_open(byref(self._cf), filename), self._gp)
 
     def save(self, filename=None):
         if filename is None:
             filename = self.name
 
         # deprecated as of libgphoto2 2.5.0
-        # _check_result(gp.gp_file_save(self._cf, filename))
+        # _check_result(self._gp.gp_file_save(self._cf, filename), self._gp)
 
         file = open(filename, 'wb')
-        file.write(self.to_pixbuf())
+        file.write(self.buffer())
         file.close()
 
     def get_data(self):
-        data = ctypes.pointer(ctypes.c_char())
+        """Returns a copy of the file data as bytes; see buffer()."""
+        return self.buffer().tobytes()
+
+    def buffer(self):
+        """Returns a memoryview over the file data, without copying.
+
+        The view holds its own libgphoto2 reference on the file, so it stays
+        valid after the CameraFile object itself is gone.
+        """
+        buf = self._buffer()
+        buf._ref = _FileRef(self._cf, self._gp)
+        return memoryview(buf)
+
+    def _buffer(self):
+        """Returns a ctypes array over the data owned by libgphoto2 (no copy)."""
+        data = ctypes.c_void_p()
         size = ctypes.c_ulong()
-        _check_result(gp.gp_file_get_data_and_size(
+        _check_result(self._gp.gp_file_get_data_and_size(
             self._cf,
             ctypes.byref(data),
-            ctypes.byref(size)))
-        return ctypes.string_at(data, size.value)
+            ctypes.byref(size)), self._gp)
+        if not data.value:
+            return (ctypes.c_ubyte * 0)()
+        return (ctypes.c_ubyte * size.value).from_address(data.value)
 
     def ref(self):
-        _check_result(gp.gp_file_ref(self._cf))
+        _check_result(self._gp.gp_file_ref(self._cf), self._gp)
 
     def unref(self):
-        _check_result(gp.gp_file_unref(self._cf))
+        _check_result(self._gp.gp_file_unref(self._cf), self._gp)
 
     def clean(self):
-        _check_result(gp.gp_file_clean(self._cf))
+        _check_result(self._gp.gp_file_clean(self._cf), self._gp)
 
     def copy(self, source):
-        _check_result(gp.gp_file_copy(self._cf, source._cf))
+        _check_result(self._gp.gp_file_copy(self._cf, source._cf), self._gp)
 
     # do we need this?
     def to_pixbuf(self):
-        mimetype = ctypes.c_char_p()
-        gp.gp_file_get_mime_type(self._cf, ctypes.byref(mimetype))
-        print(ctypes.string_at(mimetype))
-
         """Returns data for GdkPixbuf.PixbufLoader.write()."""
-        data = ctypes.c_char_p()
-        size = ctypes.c_ulong()
-        gp.gp_file_get_data_and_size(self._cf, ctypes.byref(data),
-                                     ctypes.byref(size))
-
-        print(size.value)
-        return ctypes.string_at(data, size.value)
+        return self.buffer()
 
     def __dealoc__(self, filename):
-        _check_result(gp.gp_file_free(self._cf))
+        _check_result(self._gp.gp_file_free(self._cf), self._gp)
 
     @property
     def name(self):
         name = ctypes.c_char_p()
-        _check_result(gp.gp_file_get_name(self._cf, byref(name)))
+        _check_result(self._gp.gp_file_get_name(self._cf, byref(name)), self._gp)
         return name.value.decode("utf-8")
 
     @name.setter
     def name(self, name):
-        _check_result(gp.gp_file_set_name(self._cf, str(name)))
+        _check_result(self._gp.gp_file_set_name(self._cf, _cstr(name)), self._gp)
 
     def __del__(self):
-        self.unref()
+        # already released if the download failed
+        if self._cf.value:
+            self.unref()
 
-    # TODO: new_from_fd (?), new_from_handler (?), mime_tipe, mtime,
+    # TODO: mime_tipe, mtime,
     # detect_mime_type, adjust_name_for_mime_type, data_and_size,
     # append, slurp, python file object?
 
 
-class CameraAbilitiesList(object):
-    _static_l = None
+class _FileRef(object):
+    """Keeps a libgphoto2 reference on a file for as long as a buffer
+    returned by CameraFile.buffer() is alive."""
 
-    def __init__(self):
-        if CameraAbilitiesList._static_l is None:
-            CameraAbilitiesList._static_l = ctypes.c_void_p()
-            _check_result(gp.gp_abilities_list_new(byref(CameraAbilitiesList._static_l)))
-            _check_result(gp.gp_abilities_list_load(CameraAbilitiesList._static_l, context))
-        self._l = CameraAbilitiesList._static_l
+    def __init__(self, cf, backend):
+        self._gp = backend
+        self._cf = ctypes.c_void_p(cf.value)
+        _check_result(self._gp.gp_file_ref(self._cf), self._gp)
+
+    def __del__(self):
+        self._gp.gp_file_unref(self._cf)
+
+
+def _regular_fd(fileobj):
+    """The descriptor of fileobj if it is a seekable regular file, else None
+    (BytesIO, pipes, sockets, ...)."""
+    try:
+        fd = fileobj.fileno()
+        if not stat.S_ISREG(os.fstat(fd).st_mode):
+            return None
+        os.lseek(fd, 0, os.SEEK_CUR)
+    except (AttributeError, OSError, ValueError):
+        # io.UnsupportedOperation is both an OSError and a ValueError
+        return None
+    return fd
+
+
+def _write_all(fileobj, data):
+    # raw files and sockets may write less than asked for
+    data = memoryview(data)
+    while len(data):
+        n = fileobj.write(data)
+        if n is None:
+            break
+        data = data[n:]
+
+
+class _StreamWriter(object):
+    """The write() side of a CameraFileHandler, passing the chunks
+    libgphoto2 receives on to a Python file object.
+
+    Every chunk costs one trip back into Python (and the GIL), which is noise
+    next to the USB transfer of the chunk.
+    """
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.written = 0
+        self.error = None
+        # the callbacks must stay alive for as long as libgphoto2 may call them
+        self.struct = CameraFileHandler(_handler_size_func(self._size),
+                                        _handler_rw_func(self._read),
+                                        _handler_rw_func(self._write))
+
+    def _size(self, priv, size):
+        size[0] = self.written
+        return GP_OK
+
+    def _read(self, priv, data, length):
+        # only used when uploading files to the camera
+        return GP_ERROR
+
+    def _write(self, priv, data, length):
+        n = length[0]
+        try:
+            _write_all(self.fileobj, ctypes.string_at(data, n))
+        except Exception as e:
+            self.error = e
+            return GP_ERROR
+        self.written += n
+        return GP_OK
+
+
+class CameraAbilitiesList(object):
+    # one list per library
+    _static_l = {}
+
+    def __init__(self, backend=None):
+        self._gp = backend if backend is not None else gp
+        if self._gp not in CameraAbilitiesList._static_l:
+            l = ctypes.c_void_p()
+            _check_result(self._gp.gp_abilities_list_new(byref(l)), self._gp)
+            _check_result(self._gp.gp_abilities_list_load(l, context), self._gp)
+            CameraAbilitiesList._static_l[self._gp] = l
+        self._l = CameraAbilitiesList._static_l[self._gp]
 
     def __del__(self):
         # don't free, since it is only created once
-        # _check_result(gp.gp_abilities_list_free(self._l))
+        # _check_result(self._gp.gp_abilities_list_free(self._l), self._gp)
         pass
 
     def detect(self, il, l):
-        _check_result(gp.gp_abilities_list_detect(self._l, il._l, l._l, context))
+        _check_result(self._gp.gp_abilities_list_detect(self._l, il._l, l._l, context), self._gp)
 
     def lookup_model(self, model):
-        return _check_result(gp.gp_abilities_list_lookup_model(self._l, model))
+        return _check_result(self._gp.gp_abilities_list_lookup_model(self._l, model), self._gp)
 
     def get_abilities(self, model_index, ab):
-        _check_result(gp.gp_abilities_list_get_abilities(self._l, model_index, byref(ab._ab)))
+        _check_result(self._gp.gp_abilities_list_get_abilities(self._l, model_index, byref(ab._ab)), self._gp)
 
 
 class CameraAbilities(object):
@@ -545,50 +1262,63 @@ class CameraAbilities(object):
 
 
 class PortInfoList(object):
-    _static_l = None
-
-    def __init__(self):
-        if PortInfoList._static_l is None:
-            PortInfoList._static_l = ctypes.c_void_p()
-            _check_result(gp.gp_port_info_list_new(byref(PortInfoList._static_l)))
-            _check_result(gp.gp_port_info_list_load(PortInfoList._static_l))
-        self._l = PortInfoList._static_l
+    # one list per library
+    _static_l = {}
+
+    def __init__(self, backend=None):
+        self._gp = backend if backend is not None else gp
+        if self._gp not in PortInfoList._static_l:
+            l = ctypes.c_void_p()
+            _check_result(self._gp.gp_port_info_list_new(byref(l)), self._gp)
+            _check_result(self._gp.gp_port_info_list_load(l), self._gp)
+            PortInfoList._static_l[self._gp] = l
+        self._l = PortInfoList._static_l[self._gp]
 
     def __del__(self):
         # don't free, since it is only created once
-        # _check_result(gp.gp_port_info_list_free(self._l))
+        # _check_result(self._gp.gp_port_info_list_free(self._l), self._gp)
         pass
 
+    @staticmethod
+    def reload(backend=None):
+        """Makes the next PortInfoList of backend list the ports again, e.g.
+        after a camera was plugged in on a new USB device number. The old
+        list is not freed, port infos taken from it stay valid."""
+        PortInfoList._static_l.pop(backend if backend is not None else gp, None)
+
     def count(self):
-        c = gp.gp_port_info_list_count(self._l)
-        _check_result(c)
+        c = self._gp.gp_port_info_list_count(self._l)
+        _check_result(c, self._gp)
         return c
 
     def lookup_path(self, path):
-        index = gp.gp_port_info_list_lookup_path(self._l, path)
-        _check_result(index)
+        index = self._gp.gp_port_info_list_lookup_path(self._l, path)
+        _check_result(index, self._gp)
         return index
 
     def get_info(self, path_index):
         info = PortInfo()
-        _check_result(gp.gp_port_info_list_get_info(self._l, path_index, byref(info)))
+        _check_result(self._gp.gp_port_info_list_get_info(self._l, path_index, byref(info)), self._gp)
         return info
 
 
 class CameraList(object):
-    def __init__(self, autodetect=False):
+    def __init__(self, autodetect=False, context=None, backend=None):
+        self._gp = backend if backend is not None else gp
         self._l = ctypes.c_void_p()
-        _check_result(gp.gp_list_new(byref(self._l)))
+        _check_result(self._gp.gp_list_new(byref(self._l)), self._gp)
+        if context is None:
+            context = _default_context()
 
         if autodetect:
-            if hasattr(gp, 'gp_camera_autodetect'):
-                gp.gp_camera_autodetect(self._l, context)
+            if hasattr(self._gp, 'gp_camera_autodetect'):
+                self._gp.gp_camera_autodetect(self._l, context)
             else:
                 # this is for stable versions of gphoto <= 2.4.10.1
-                xlist = CameraList()
-                il = PortInfoList()
+                xlist = CameraList(backend=self._gp)
+                il = PortInfoList(self._gp)
                 il.count()
-                al = CameraAbilitiesList()
+                al = CameraAbilitiesList(self._gp)
                 al.detect(il, xlist)
 
                 # begin USB bug code
@@ -616,48 +1346,51 @@ class CameraList(object):
                 del xlist
 
     def ref(self):
-        _check_result(gp.gp_list_ref(self._l))
+        _check_result(self._gp.gp_list_ref(self._l), self._gp)
 
     def unref(self):
-        _check_result(gp.gp_list_ref(self._l))
+        _check_result(self._gp.gp_list_ref(self._l), self._gp)
 
     def __del__(self):
         # this failed once in gphoto 2.4.6
-        _check_result(gp.gp_list_free(self._l))
+        _check_result(self._gp.gp_list_free(self._l), self._gp)
         pass
 
     def reset(self):
-        _check_result(gp.gp_list_reset(self._l))
+        _check_result(self._gp.gp_list_reset(self._l), self._gp)
 
     def append(self, name, value):
-        _check_result(gp.gp_list_append(self._l, str(name), str(value)))
+        _check_result(self._gp.gp_list_append(self._l, _cstr(name), _cstr(value)), self._gp)
 
     def sort(self):
-        _check_result(gp.gp_list_sort(self._l))
+        _check_result(self._gp.gp_list_sort(self._l), self._gp)
 
     def count(self):
-        return _check_result(gp.gp_list_count(self._l))
+        return _check_result(self._gp.gp_list_count(self._l), self._gp)
 
     def find_by_name(self, name):
         index = ctypes.c_int()
-        _check_result(gp.gp_list_find_by_name(self._l, byref(index), str(name)))
+        _check_result(self._gp.gp_list_find_by_name(self._l, byref(index), _cstr(name)), self._gp)
         return index.value
 
     def get_name(self, index):
         name = ctypes.c_char_p()
-        _check_result(gp.gp_list_get_name(self._l, int(index), byref(name)))
+        _check_result(self._gp.gp_list_get_name(self._l, int(index), byref(name)), self._gp)
         return name.value.decode("utf-8")
 
     def get_value(self, index):
         value = ctypes.c_char_p()
-        _check_result(gp.gp_list_get_value(self._l, int(index), byref(value)))
+        _check_result(self._gp.gp_list_get_value(self._l, int(index), byref(value)), self._gp)
+        # file and folder listings have no values
+        if value.value is None:
+            return None
         return value.value.decode("utf-8")
 
     def set_name(self, index, name):
-        _check_result(gp.gp_list_set_name(self._l, int(index), str(name)))
+        _check_result(self._gp.gp_list_set_name(self._l, int(index), _cstr(name)), self._gp)
 
     def set_value(self, index, value):
-        _check_result(gp.gp_list_set_value(self._l, int(index), str(value)))
+        _check_result(self._gp.gp_list_set_value(self._l, int(index), _cstr(value)), self._gp)
 
     def __str__(self):
         header = "CameraList object with %d elements:\n" % self.count()
@@ -683,77 +1416,124 @@ class CameraList(object):
 
 class CameraWidget(object):
 
-    def __init__(self, type=None, label=""):
+    def __init__(self, type=None, label="", backend=None):
+        self._gp = backend if backend is not None else gp
         self._w = ctypes.c_void_p()
+        # the widget owning the tree; children keep it alive
+        self._root = None
+        # widgets whose value was set inside Camera.config_batch()
+        self._dirty = None
+        # a value was set somewhere in the tree (kept on the root)
+        self._edited = False
         if type is not None:
-            _check_result(gp.gp_widget_new(int(type), str(label), byref(self._w)))
-            _check_result(gp.gp_widget_ref(self._w))
+            _check_result(self._gp.gp_widget_new(int(type), _cstr(label), byref(self._w)), self._gp)
+            _check_result(self._gp.gp_widget_ref(self._w), self._gp)
         else:
             self._w = ctypes.c_void_p()
 
     def __repr__(self):
         return "%s:%s:%s:%s:%s" % (self.label, self.name, self.info, self.typestr, self.value)
 
+    def __getattr__(self, name):
+        # Lazy access to the tree: config.main.imgsettings.iso only looks up
+        # the widgets on the way down, each one the first time it is touched.
+        if name.startswith('_'):
+            raise AttributeError(name)
+        if name == self.name:
+            # the window is its own top-level section, as with populate_children()
+            child = self
+        else:
+            try:
+                child = self.get_child_by_name(name)
+            except libgphoto2error:
+                raise AttributeError(name)
+        self.__dict__[name] = child
+        return child
+
+    def __setattr__(self, name, value):
+        # config.iso = "400" sets the value of the child widget; a name that
+        # is not in the tree is an error rather than a silent Python attribute
+        if name.startswith('_') or hasattr(type(self), name):
+            object.__setattr__(self, name, value)
+            return
+        try:
+            child = self.__getattr__(name)
+        except AttributeError:
+            raise AttributeError("no config widget named %r" % name)
+        child.value = value
+
+    def __getitem__(self, name):
+        try:
+            return self.get_child_by_name(name)
+        except libgphoto2error:
+            raise KeyError(name)
+
+    def _child(self):
+        w = CameraWidget(backend=self._gp)
+        w._root = self._root or self
+        return w
+
     def ref(self):
-        _check_result(gp.gp_widget_ref(self._w))
+        _check_result(self._gp.gp_widget_ref(self._w), self._gp)
 
     def unref(self):
-        _check_result(gp.gp_widget_unref(self._w))
+        _check_result(self._gp.gp_widget_unref(self._w), self._gp)
 
     def __del__(self):
         # TODO: fix this or find a good reason not to
         # print "widget(%s) __del__" % self.name
-        # _check_result(gp.gp_widget_unref(self._w))
+        # _check_result(self._gp.gp_widget_unref(self._w), self._gp)
         pass
 
     @property
     def info(self):
         info = ctypes.c_char_p()
-        _check_result(gp.gp_widget_get_info(self._w, byref(info)))
+        _check_result(self._gp.gp_widget_get_info(self._w, byref(info)), self._gp)
         return info.value.decode("utf-8")
 
     @info.setter
     def info(self, info):
-        _check_result(gp.gp_widget_set_info(self._w, str(info)))
+        _check_result(self._gp.gp_widget_set_info(self._w, _cstr(info)), self._gp)
 
     @property
     def name(self):
         name = ctypes.c_char_p()
-        _check_result(gp.gp_widget_get_name(self._w, byref(name)))
+        _check_result(self._gp.gp_widget_get_name(self._w, byref(name)), self._gp)
         return name.value.decode("utf-8")
 
     @name.setter
     def name(self, name):
-        _check_result(gp.gp_widget_set_name(self._w, str(name)))
+        _check_result(self._gp.gp_widget_set_name(self._w, _cstr(name)), self._gp)
 
     @property
     def id(self):
         id = ctypes.c_int()
-        _check_result(gp.gp_widget_get_id(self._w, byref(id)))
+        _check_result(self._gp.gp_widget_get_id(self._w, byref(id)), self._gp)
         return id.value
 
     @property
     def changed(self):
-        return gp.gp_widget_changed(self._w)
+        """Note: libgphoto2 clears the flag when it is read."""
+        return self._gp.gp_widget_changed(self._w)
 
     @changed.setter
-    def _set_changed(self, changed):
-        _check_result(gp.gp_widget_set_changed(self._w, str(changed)))
+    def changed(self, changed):
+        _check_result(self._gp.gp_widget_set_changed(self._w, int(changed)), self._gp)
 
     @property
     def readonly(self):
         readonly = ctypes.c_int()
-        _check_result(gp.gp_widget_get_readonly(self._w, byref(readonly)))
+        _check_result(self._gp.gp_widget_get_readonly(self._w, byref(readonly)), self._gp)
         return readonly.value
 
     @readonly.setter
     def readonly(self, readonly):
-        _check_result(gp.gp_widget_set_readonly(self._w, int(readonly)))
+        _check_result(self._gp.gp_widget_set_readonly(self._w, int(readonly)), self._gp)
 
     @property
     def type(self):
         type = ctypes.c_int()
-        _check_result(gp.gp_widget_get_type(self._w, byref(type)))
+        _check_result(self._gp.gp_widget_get_type(self._w, byref(type)), self._gp)
         return type.value
 
     @property
@@ -763,30 +1543,29 @@ class CameraWidget(object):
     @property
     def label(self):
         label = ctypes.c_char_p()
-        _check_result(gp.gp_widget_get_label(self._w, byref(label)))
+        _check_result(self._gp.gp_widget_get_label(self._w, byref(label)), self._gp)
         return label.value.decode("utf-8")
 
     @label.setter
     def label(self, label):
-        _check_result(gp.gp_widget_set_label(self._w, str(label)))
+        _check_result(self._gp.gp_widget_set_label(self._w, _cstr(label)), self._gp)
 
     @property
     def value(self):
         value = ctypes.c_void_p()
-        ans = gp.gp_widget_get_value(self._w, byref(value))
-        _check_result(ans)
+        ans = self._gp.gp_widget_get_value(self._w, byref(value))
+        _check_result(ans, self._gp)
 
-        if self.type in [GP_WIDGET_MENU, GP_WIDGET_RADIO, GP_WIDGET_TEXT]:
+        type = self.type
+        if type in [GP_WIDGET_MENU, GP_WIDGET_RADIO, GP_WIDGET_TEXT]:
             v = ctypes.cast(value.value, ctypes.c_char_p).value
             if v is not None:
                 return v.decode("utf-8")
             return ""
-        elif self.type == GP_WIDGET_RANGE:
-            lower, upper, step = ctypes.c_float(), ctypes.c_float(), ctypes.c_float()
-            gp.gp_widget_get_range(self._w, byref(lower), byref(upper), byref(step))
-
-            return (lower.value, upper.value, step.value)
-        elif self.type in [GP_WIDGET_TOGGLE, GP_WIDGET_DATE]:
+        elif type == GP_WIDGET_RANGE:
+            # the float is stored in place of the pointer, use .range for the bounds
+            return ctypes.cast(ctypes.addressof(value), ctypes.POINTER(ctypes.c_float))[0]
+        elif type in [GP_WIDGET_TOGGLE, GP_WIDGET_DATE]:
             return ctypes.cast(ctypes.addressof(value), ctypes.POINTER(ctypes.c_int))[0]
         else:
             return None
@@ -794,7 +1573,7 @@ class CameraWidget(object):
     @value.setter
     def value(self, value):
         if self.type in (GP_WIDGET_MENU, GP_WIDGET_RADIO, GP_WIDGET_TEXT):
-            value = ctypes.c_char_p(value)
+            value = ctypes.c_char_p(_cstr(value))
         elif self.type == GP_WIDGET_RANGE:
             # According to libgphoto 2.5 docs ( http://enkore.de/libgphoto2-docs/ )
             # "Please pass (char*) for GP_WIDGET_MENU, GP_WIDGET_TEXT, GP_WIDGET_RADIO,
@@ -807,37 +1586,41 @@ class CameraWidget(object):
         else:
             raise NotImplementedError()
 
-        _check_result(gp.gp_widget_set_value(self._w, value))
+        _check_result(self._gp.gp_widget_set_value(self._w, value), self._gp)
+        root = self._root or self
+        root._edited = True
+        if root._dirty is not None:
+            root._dirty[self.name] = self
 
     def append(self, child):
-        _check_result(gp.gp_widget_append(self._w, child._w))
+        _check_result(self._gp.gp_widget_append(self._w, child._w), self._gp)
 
     def prepend(self, child):
-        _check_result(gp.gp_widget_prepend(self._w, child._w))
+        _check_result(self._gp.gp_widget_prepend(self._w, child._w), self._gp)
 
     def count_children(self):
-        return gp.gp_widget_count_children(self._w)
+        return self._gp.gp_widget_count_children(self._w)
 
     def get_child(self, child_number):
-        w = CameraWidget()
-        _check_result(gp.gp_widget_get_child(self._w, int(child_number), byref(w._w)))
-        _check_result(gp.gp_widget_ref(w._w))
+        w = self._child()
+        _check_result(self._gp.gp_widget_get_child(self._w, int(child_number), byref(w._w)), self._gp)
+        _check_result(self._gp.gp_widget_ref(w._w), self._gp)
         return w
 
     def get_child_by_label(self, label):
-        w = CameraWidget()
-        _check_result(gp.gp_widget_get_child_by_label(self._w, str(label), byref(w._w)))
+        w = self._child()
+        _check_result(self._gp.gp_widget_get_child_by_label(self._w, _cstr(label), byref(w._w)), self._gp)
         return w
 
     def get_child_by_id(self, id):
-        w = CameraWidget()
-        _check_result(gp.gp_widget_get_child_by_id(self._w, int(id), byref(w._w)))
+        w = self._child()
+        _check_result(self._gp.gp_widget_get_child_by_id(self._w, int(id), byref(w._w)), self._gp)
         return w
 
     def get_child_by_name(self, name):
-        w = CameraWidget()
+        w = self._child()
         # this fails in 2.4.6 (Ubuntu 9.10)
-        _check_result(gp.gp_widget_get_child_by_name(self._w, str(name), byref(w._w)))
+        _check_result(self._gp.gp_widget_get_child_by_name(self._w, _cstr(name), byref(w._w)), self._gp)
         return w
 
     @property
@@ -849,25 +1632,25 @@ class CameraWidget(object):
 
     @property
     def parent(self):
-        w = CameraWidget()
-        _check_result(gp.gp_widget_get_parent(self._w, byref(w._w)))
+        w = self._child()
+        _check_result(self._gp.gp_widget_get_parent(self._w, byref(w._w)), self._gp)
         return w
 
     @property
     def root(self):
-        w = CameraWidget()
-        _check_result(gp.gp_widget_get_root(self._w, byref(w._w)))
+        w = self._child()
+        _check_result(self._gp.gp_widget_get_root(self._w, byref(w._w)), self._gp)
         return w
 
     @property
     def range(self):
         """CameraWidget.range => (min, max, increment)"""
         min, max, increment = ctypes.c_float(), ctypes.c_float(), ctypes.c_float()
-        _check_result(gp.gp_widget_set_range(
+        _check_result(self._gp.gp_widget_get_range(
             self._w,
             byref(min),
             byref(max),
-            byref(increment)))
+            byref(increment)), self._gp)
         return (min.value, max.value, increment.value)
 
     @range.setter
@@ -875,24 +1658,24 @@ class CameraWidget(object):
         """CameraWidget.range = (min, max, increment)"""
         float = ctypes.c_float
         min, max, increment = range
-        _check_result(gp.gp_widget_set_range(
+        _check_result(self._gp.gp_widget_set_range(
             self._w,
             float(min),
             float(max),
-            float(increment)))
+            float(increment)), self._gp)
 
     def add_choice(self, choice):
-        _check_result(gp.gp_widget_add_choice(self._w, str(choice)))
+        _check_result(self._gp.gp_widget_add_choice(self._w, _cstr(choice)), self._gp)
 
     def count_choices(self):
-        return gp.gp_widget_count_choices(self._w)
+        return self._gp.gp_widget_count_choices(self._w)
 
     def get_choice(self, choice_number):
         choice = ctypes.c_char_p()
         _check_result(
-            gp.gp_widget_get_choice(
+            self._gp.gp_widget_get_choice(
                 self._w, int(choice_number),
-                byref(choice)))
+                byref(choice)), self._gp)
         return choice.value.decode("utf-8")
 
     @property
@@ -925,9 +1708,38 @@ class CameraWidget(object):
             else:
                 setattr(simplewidget, c.name, c)
 
+    def walk(self, path=None):
+        """Yields (path, widget) for this widget and everything below it,
+        visiting each widget exactly once."""
+        if path is None:
+            path = self.name
+        yield path, self
+        for i in xrange(self.count_children()):
+            c = self.get_child(i)
+            for item in c.walk(path + "." + c.name):
+                yield item
+
+    def index(self):
+        """Returns a {name: widget} dict of the whole tree, built in one pass."""
+        return dict((w.name, w) for path, w in self.walk())
+
+    def snapshot(self):
+        """Reads every setting below this widget once into a ConfigSnapshot."""
+        widgets = []
+        for path, w in self.walk():
+            type = w.type
+            if type in (GP_WIDGET_WINDOW, GP_WIDGET_SECTION):
+                continue
+            widgets.append(WidgetSnapshot(
+                path, w.name, w.label, type, w.value,
+                w.range if type == GP_WIDGET_RANGE else None,
+                tuple(w.choices) if type in (GP_WIDGET_MENU, GP_WIDGET_RADIO) else (),
+                bool(w.readonly)))
+        return ConfigSnapshot(widgets)
+
     def populate_children(self):
         simplewidget = CameraWidgetSimple()
-        setattr(self, self.name, simplewidget)
+        self.__dict__[self.name] = simplewidget
         simplewidget.__doc__ = self.createdoc()
         self._pop(simplewidget)
 
@@ -0,0 +1,96 @@
+"""asyncio front-end (Python 3.7+).
+
+    cam = await AsyncCamera.open()
+    await cam.capture_image("snap.jpg")
+    async for frame in cam.previews():
+        ...
+    await cam.close()
+
+Every AsyncCamera runs the blocking libgphoto2 calls on its own single
+worker thread: operations on one camera are serialized, while the event loop
+and other cameras keep going.
+"""
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from . import Camera, GP_EVENT_TIMEOUT
+
+
+class AsyncCamera(object):
+    def __init__(self, camera, executor=None):
+        """Wraps an already opened Camera, see also AsyncCamera.open()."""
+        self.camera = camera
+        self._executor = executor or ThreadPoolExecutor(max_workers=1)
+
+    @classmethod
+    async def open(cls, **kwargs):
+        """Opens a Camera(**kwargs) without blocking the event loop."""
+        executor = ThreadPoolExecutor(max_workers=1)
+        try:
+            camera = await asyncio.get_running_loop().run_in_executor(
+                executor, functools.partial(Camera, **kwargs))
+        except BaseException:
+            executor.shutdown(wait=False)
+            raise
+        return cls(camera, executor)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    def _call(self, fn, *args, **kwargs):
+        with self.camera.lock:
+            return fn(*args, **kwargs)
+
+    async def run(self, fn, *args, **kwargs):
+        """Runs fn(*args, **kwargs) on this camera's worker thread."""
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, functools.partial(self._call, fn, *args, **kwargs))
+
+    async def capture_image(self, destpath=None):
+        return await self.run(self.camera.capture_image, destpath)
+
+    async def capture_preview(self, destpath=None):
+        return await self.run(self.camera.capture_preview, destpath)
+
+    async def download_file(self, srcfolder, srcfilename, destpath):
+        return await self.run(self.camera.download_file, srcfolder, srcfilename, destpath)
+
+    async def download_to(self, fileobj, srcfolder, srcfilename):
+        return await self.run(self.camera.download_to, fileobj, srcfolder, srcfilename)
+
+    async def trigger_capture(self):
+        return await self.run(self.camera.trigger_capture)
+
+    async def get_setting(self, name):
+        return await self.run(self.camera.get_setting, name)
+
+    async def set_setting(self, name, value):
+        return await self.run(self.camera.set_setting, name, value)
+
+    async def wait_for_event(self, timeout=1000):
+        return await self.run(self.camera.wait_for_event, timeout)
+
+    async def events(self, timeout=1000):
+        """Yields CameraEvents as the camera reports them, see Camera.events()."""
+        while True:
+            event = await self.wait_for_event(timeout)
+            if event.type != GP_EVENT_TIMEOUT:
+                yield event
+
+    async def previews(self):
+        """Yields live view frames, see Camera.stream_previews(). The next
+        frame is only captured once the previous one has been consumed."""
+        frames = self.camera.stream_previews()
+        try:
+            while True:
+                yield await self.run(next, frames)
+        finally:
+            await self.run(frames.close)
+
+    async def close(self):
+        await self.run(self.camera.close)
+        self._executor.shutdown(wait=False)
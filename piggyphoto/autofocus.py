@@ -0,0 +1,184 @@
+"""Contrast autofocus through the live view and the manual focus drive.
+
+    af = AutoFocus(camera, roi=(400, 250, 656, 454))
+    result = af.run()
+    print(result.position, result.frames)
+    for entry in result.trace:
+        print(entry)
+
+The lens is moved with the manualfocusdrive setting ("Near 1".."Near 3",
+"Far 1".."Far 3" on Canon bodies), whose steps are relative, so positions
+are counted in units of the smallest step from where run() started. Steps
+the body refuses at the end of the lens travel are not counted. Each
+level, from the coarsest step to the finest, climbs towards higher focus
+scores until a score drops. A parabola through the last three scores then
+estimates the peak, and the next, finer level starts from there.
+"""
+from collections import namedtuple
+
+from . import focus, libgphoto2error, GP_ERROR
+
+# relative size of the focus drive steps 1, 2 and 3, in units of step 1
+STEP_UNITS = {1: 1, 2: 8, 3: 64}
+
+# one scored frame: position in units, the level (drive step) being climbed
+TraceEntry = namedtuple('TraceEntry', ['position', 'level', 'score'])
+AutoFocusResult = namedtuple('AutoFocusResult', ['position', 'score', 'frames', 'trace'])
+
+
+def parabola_peak(a, b, c):
+    """Offset, in [-1, 1], of the vertex of the parabola through (-1, a),
+    (0, b), (1, c), where b is the highest."""
+    denom = a - 2 * b + c
+    if denom >= 0:
+        return 0.0
+    return max(-1.0, min(1.0, 0.5 * (a - c) / denom))
+
+
+class FocusDrive(object):
+    """Relative lens moves through the focus drive setting, keeping track of
+    the position in units of the smallest step."""
+
+    def __init__(self, camera, setting="manualfocusdrive", step_units=STEP_UNITS):
+        self.camera = camera
+        self.setting = setting
+        self.step_units = step_units
+        self.position = 0
+        # "Near" or "Far" when the last move was stopped by the end of the
+        # lens travel
+        self.limit = None
+
+    def move(self, units):
+        """Moves the focus by units (positive is towards infinity) with as
+        few drive steps as possible. Returns the units actually moved, which
+        falls short if units is not a sum of step sizes or the lens reaches
+        the end of its travel."""
+        direction = "Far" if units > 0 else "Near"
+        left = abs(units)
+        self.limit = None
+        for level in sorted(self.step_units, key=self.step_units.get, reverse=True):
+            size = self.step_units[level]
+            while left >= size:
+                try:
+                    self.camera.set_setting(self.setting, "%s %d" % (direction, level))
+                except libgphoto2error as e:
+                    if e.result != GP_ERROR:
+                        raise
+                    # a step past the end is refused; finer ones may still fit
+                    self.limit = direction
+                    break
+                left -= size
+        moved = units - (left if units > 0 else -left)
+        self.position += moved
+        return moved
+
+
+class AutoFocus(object):
+    def __init__(self, camera, metric='tenengrad', roi=None, levels=(3, 2, 1),
+                 setting="manualfocusdrive", step_units=STEP_UNITS, settle_frames=0,
+                 max_frames=100, decoder=None):
+        """
+        metric, roi, decoder: the focus measure, see piggyphoto.focus.measure().
+            A reduced-scale piggyphoto.jpeg.Decoder makes each frame cheaper
+            to score; roi is then in the pixels of the reduced frame.
+        levels: the drive steps used, coarsest first.
+        settle_frames: live view frames dropped after each move, for bodies
+            that return a frame or two taken while the lens was moving.
+        max_frames: gives up (keeping the best position so far) after this
+            many scored frames.
+        """
+        self.camera = camera
+        self.metric = metric
+        self.roi = roi
+        self.decoder = decoder
+        self.levels = levels
+        self.drive = FocusDrive(camera, setting, step_units)
+        self.step_units = step_units
+        self.settle_frames = settle_frames
+        self.max_frames = max_frames
+        self.trace = []
+        self._frames = None
+        self._scores = {}
+
+    @property
+    def position(self):
+        return self.drive.position
+
+    def move(self, units):
+        if self.drive.move(units):
+            for i in range(self.settle_frames):
+                next(self._frames)
+
+    def score(self, level=0):
+        """Scores a fresh frame at the current position."""
+        frame = next(self._frames)
+        s = focus.measure(frame, (self.metric,), self.roi, decoder=self.decoder)[self.metric]
+        self._scores[self.position] = s
+        self.trace.append(TraceEntry(self.position, level, s))
+        return s
+
+    def _score_at(self, position, level):
+        # None if the lens stops short of position at the end of its travel;
+        # where it stopped is scored instead
+        if position not in self._scores:
+            self.move(position - self.position)
+            self.score(level)
+        return self._scores.get(position)
+
+    def _edge(self, best):
+        # the better of best and the end of the travel, where the lens is
+        if self._scores[self.position] > self._scores[best]:
+            return self.position
+        return best
+
+    def _climb(self, level):
+        # returns the estimated peak position, in units
+        step = self.step_units[level]
+        best = self.position
+        here = self._score_at(best, level)
+        direction = 1
+        up = self._score_at(best + step, level)
+        if up is None and self._edge(best) != best:
+            return self.position
+        if up is None or up <= here:
+            direction = -1
+            down = self._score_at(best - step, level)
+            if down is None:
+                return self._edge(best)
+            if down <= here:
+                if up is None:
+                    return best
+                # the peak is within a step either side
+                return best + step * parabola_peak(down, here, up)
+        best += direction * step
+        while len(self.trace) < self.max_frames:
+            ahead = best + direction * step
+            score = self._score_at(ahead, level)
+            if score is None:
+                return self._edge(best)
+            if score <= self._scores[best]:
+                return best + direction * step * parabola_peak(
+                    self._scores[best - direction * step], self._scores[best], score)
+            best = ahead
+        return best
+
+    def run(self):
+        """Focuses and returns an AutoFocusResult. position is relative to
+        where the lens was when run() was called."""
+        self.drive.position = 0
+        self.trace = []
+        self._scores = {}
+        self._frames = self.camera.stream_previews()
+        try:
+            for level in self.levels:
+                if len(self.trace) >= self.max_frames:
+                    break
+                peak = self._climb(level)
+                self.move(int(round(peak)) - self.position)
+            score = self._scores.get(self.position)
+            if score is None:
+                score = self.score()
+        finally:
+            self._frames.close()
+            self._frames = None
+        return AutoFocusResult(self.position, score, len(self.trace), self.trace)
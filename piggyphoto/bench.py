@@ -0,0 +1,285 @@
+"""Timing of camera operations.
+
+    python -m piggyphoto.bench suite [-n 20] [--sim 1]
+    python -m piggyphoto.bench setting [iso]
+    python -m piggyphoto.bench concurrency [preview|capture|config]
+
+suite prints JSON with p50/p95/p99 latencies of previews, captures,
+downloads, config fetches, single setting changes and autodetection.
+--sim N runs against N simulated cameras (see piggyphoto.sim) instead of
+the attached ones, also where libgphoto2 is not installed. They answer
+instantly, except for concurrency, where they wait about as long as a body
+on USB (SIM_LATENCY).
+"""
+from __future__ import print_function
+import argparse
+import json
+import math
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+_clock = getattr(time, 'perf_counter', time.time)
+
+
+def timeit(fn, n):
+    """Calls fn() n times and returns the latency of each call in seconds."""
+    times = []
+    for i in range(n):
+        t = _clock()
+        fn()
+        times.append(_clock() - t)
+    return times
+
+
+def percentile(times, p):
+    """Nearest-rank percentile p (0-100) of a list of numbers.
+
+    >>> percentile([1, 2], 50)
+    1
+    >>> percentile(range(1, 21), 95)
+    19
+    >>> percentile(range(1, 101), 99)
+    99
+    >>> percentile([3], 99)
+    3
+    """
+    ordered = sorted(times)
+    k = max(0, int(math.ceil(p / 100.0 * len(ordered))) - 1)
+    return ordered[k]
+
+
+def summary(times):
+    """Returns mean/min/max and p50/p95/p99 of a list of latencies, in
+    milliseconds."""
+    return {
+        'n': len(times),
+        'mean_ms': 1000.0 * sum(times) / len(times),
+        'min_ms': 1000.0 * min(times),
+        'max_ms': 1000.0 * max(times),
+        'p50_ms': 1000.0 * percentile(times, 50),
+        'p95_ms': 1000.0 * percentile(times, 95),
+        'p99_ms': 1000.0 * percentile(times, 99),
+    }
+
+
+def bench_preview(camera, n=50):
+    """Live view frames through Camera.stream_previews(); adds fps."""
+    frames = camera.stream_previews()
+    next(frames)
+    times = timeit(lambda: next(frames), n)
+    frames.close()
+    result = summary(times)
+    result['fps'] = n / sum(times)
+    return result
+
+
+def bench_capture(camera, n=5, destdir=None):
+    """Capture-to-disk latency of Camera.capture_image(destpath)."""
+    tmp = destdir or tempfile.mkdtemp(prefix="piggyphoto-bench-")
+    shots = iter(range(n))
+    try:
+        return summary(timeit(
+            lambda: camera.capture_image(os.path.join(tmp, "bench%04d.jpg" % next(shots))), n))
+    finally:
+        if destdir is None:
+            shutil.rmtree(tmp)
+
+
+def bench_download(camera, n=5, folder=None, name=None):
+    """Downloads one file (by default a fresh capture) n times; adds the
+    transfer rate in MB/s."""
+    if folder is None:
+        folder, name = camera.capture_image()
+    size = [0]
+
+    def download():
+        size[0] = len(camera.get_file(folder, name).buffer())
+
+    result = summary(timeit(download, n))
+    result['size'] = size[0]
+    result['mb_per_s'] = size[0] / 1e6 / (result['mean_ms'] / 1000.0)
+    return result
+
+
+def bench_config(camera, n=20):
+    """Fetching the whole config tree, bypassing the cache."""
+    def fetch():
+        camera.invalidate_config()
+        return camera.config
+    return summary(timeit(fetch, n))
+
+
+def bench_set_setting(camera, name="iso", n=20):
+    """Camera.set_setting() of one setting to its current value."""
+    value = camera.get_setting(name)
+    return summary(timeit(lambda: camera.set_setting(name, value), n))
+
+
+def bench_autodetect(n=5, backend=None):
+    from piggyphoto import CameraList
+    return summary(timeit(lambda: CameraList(autodetect=True, backend=backend).count(), n))
+
+
+def bench_suite(camera, n=20, setting="iso", backend=None):
+    """Runs all of the above on one camera."""
+    captures = max(1, n // 4)
+    return {
+        'preview': bench_preview(camera, n),
+        'capture': bench_capture(camera, captures),
+        'download': bench_download(camera, captures),
+        'config': bench_config(camera, n),
+        'set_setting': bench_set_setting(camera, setting, n),
+        'autodetect': bench_autodetect(captures, backend),
+    }
+
+
+def bench_setting(camera, name, n=20):
+    """Compares reading and writing one setting through the full config
+    tree against the gp_camera_{get,set}_single_config() fast path."""
+    value = camera.get_setting(name)
+    cached_ttl = camera.config_ttl
+    camera.config_ttl = 0
+
+    def tree_get():
+        return camera.config.get_child_by_name(name).value
+
+    def tree_set():
+        window = camera.config
+        window.get_child_by_name(name).value = value
+        camera.config = window
+
+    try:
+        results = {
+            'tree_get': summary(timeit(tree_get, n)),
+            'tree_set': summary(timeit(tree_set, n)),
+            'single_get': summary(timeit(lambda: camera.get_setting(name), n)),
+            'single_set': summary(timeit(lambda: camera.set_setting(name, value), n)),
+        }
+    finally:
+        camera.config_ttl = cached_ttl
+    return results
+
+
+# operations for bench_concurrency()
+OPERATIONS = {
+    'preview': lambda camera: camera.capture_preview(),
+    'capture': lambda camera: camera.capture_image(),
+    'config': lambda camera: (camera.invalidate_config(), camera.config),
+}
+
+
+def _ticker(stop, counts):
+    # pure Python work: only advances while it holds the GIL
+    n = 0
+    while not stop.is_set():
+        n += 1
+    counts.append(n)
+
+
+def _run_concurrently(cameras, op, seconds):
+    stop = threading.Event()
+    ticks = []
+    ops = [0] * len(cameras)
+
+    def drive(i, camera):
+        while not stop.is_set():
+            op(camera)
+            ops[i] += 1
+
+    threads = [threading.Thread(target=_ticker, args=(stop, ticks))]
+    threads += [threading.Thread(target=drive, args=(i, c)) for i, c in enumerate(cameras)]
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+    return sum(ops), ticks[0]
+
+
+def bench_concurrency(cameras, op='preview', seconds=5.0):
+    """Runs op on 1, 2, ... len(cameras) cameras at once, one thread per
+    camera, next to a thread doing pure Python work.
+
+    Returns one dict per step with the aggregate ops_per_s, the speedup over
+    a single camera and ticker, the rate of the Python thread relative to
+    running it alone. A ticker close to 1 shows the GIL is released while
+    libgphoto2 works.
+    """
+    if not callable(op):
+        op = OPERATIONS[op]
+    idle = _run_concurrently([], op, seconds)[1]
+    results = []
+    for k in range(1, len(cameras) + 1):
+        ops, ticks = _run_concurrently(cameras[:k], op, seconds)
+        rate = ops / float(seconds)
+        base = results[0]['ops_per_s'] if results else rate
+        results.append({
+            'cameras': k,
+            'ops_per_s': rate,
+            'speedup': rate / base if base else 0.0,
+            'ticker': ticks / float(idle),
+        })
+    return results
+
+
+# latencies of the simulated cameras for concurrency, roughly those of a body
+# on USB 2.0; like a USB transfer, the sleep releases the GIL, so the Python
+# thread keeps running. With no latency the simulator is pure Python and
+# only competes with it for the GIL.
+SIM_LATENCY = {'preview': 0.05, 'capture': 0.3, 'config': 0.1, 'download_rate': 20e6}
+
+
+def _simulated(count, latency=None):
+    from piggyphoto.sim import SimulatedLibrary, SimulatedCamera
+    return SimulatedLibrary([SimulatedCamera(port="usb:001,%03d" % (i + 1), latency=latency)
+                             for i in range(count)])
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog="python -m piggyphoto.bench")
+    parser.add_argument('--sim', type=int, metavar='N', default=0,
+                        help="use N simulated cameras instead of the attached ones")
+    sub = parser.add_subparsers(dest='command')
+    p = sub.add_parser('suite', help="all operations, JSON output")
+    p.add_argument('-n', type=int, default=20)
+    p.add_argument('--setting', default='iso')
+    p = sub.add_parser('setting', help="get/set one setting, full tree vs single config")
+    p.add_argument('name', nargs='?', default='iso')
+    p.add_argument('-n', type=int, default=20)
+    p = sub.add_parser('concurrency', help="throughput scaling over all attached cameras")
+    p.add_argument('op', nargs='?', default='preview', choices=sorted(OPERATIONS))
+    p.add_argument('-s', '--seconds', type=float, default=5.0)
+    args = parser.parse_args(argv[1:])
+    backend = None
+    if args.sim:
+        backend = _simulated(args.sim, SIM_LATENCY if args.command == 'concurrency' else None)
+
+    if args.command in ('suite', 'setting'):
+        import piggyphoto
+        cam = piggyphoto.Camera(backend=backend)
+        try:
+            if args.command == 'suite':
+                print(json.dumps(bench_suite(cam, args.n, args.setting, backend), indent=2, sort_keys=True))
+            else:
+                for path, stats in sorted(bench_setting(cam, args.name, args.n).items()):
+                    print("%-12s %8.2f ms  (p50 %.2f, p95 %.2f, p99 %.2f, n=%d)" % (
+                        path, stats['mean_ms'], stats['p50_ms'], stats['p95_ms'], stats['p99_ms'], stats['n']))
+        finally:
+            cam.close()
+    elif args.command == 'concurrency':
+        from piggyphoto.pool import CameraPool
+        with CameraPool(backend=backend) as pool:
+            for r in bench_concurrency(pool.cameras, args.op, args.seconds):
+                print("%2d cameras  %8.2f %s/s  speedup %.2f  python thread at %3.0f%%" % (
+                    r['cameras'], r['ops_per_s'], args.op, r['speedup'], 100 * r['ticker']))
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main(sys.argv)
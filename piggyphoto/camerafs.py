@@ -0,0 +1,160 @@
+"""Cached index of the files on a camera.
+
+    fs = camera.fs
+    for folder, name in fs.glob("/store_*/DCIM/**/*.CR2"):
+        print(folder, name, fs.info(folder, name).size)
+
+Folders are listed over USB the first time they are looked at and file info
+is fetched the first time it is asked for; after that everything is answered
+from memory. Camera.wait_for_event() (and so Camera.events()) and
+Camera.capture_image() keep camera.fs up to date. libgphoto2 reports no
+event for deleted files, so remove() them, or invalidate() a folder that
+changed behind the index's back.
+"""
+import fnmatch
+import posixpath
+from collections import OrderedDict
+
+from . import GP_EVENT_FILE_ADDED, GP_EVENT_FOLDER_ADDED, GP_EVENT_FILE_CHANGED
+
+
+def _norm(folder):
+    return "/" + folder.strip("/")
+
+
+class _Folder(object):
+    __slots__ = ('files', 'folders')
+
+    def __init__(self, files, folders):
+        # file name -> FileInfo, None until fetched
+        self.files = OrderedDict((name, None) for name in files)
+        self.folders = list(folders)
+
+
+class CameraFS(object):
+    def __init__(self, camera):
+        self.camera = camera
+        self._folders = {}
+        # USB round trips, for checking the cache does its job
+        self.calls = 0
+
+    def _folder(self, folder):
+        folder = _norm(folder)
+        entry = self._folders.get(folder)
+        if entry is None:
+            with self.camera.lock:
+                files = [name for name, value in self.camera.list_files(folder)]
+                folders = [name for name, value in self.camera.list_folders(folder)]
+            self.calls += 2
+            entry = self._folders[folder] = _Folder(files, folders)
+        return entry
+
+    def list_files(self, folder="/"):
+        return list(self._folder(folder).files)
+
+    def list_folders(self, folder="/"):
+        return list(self._folder(folder).folders)
+
+    def exists(self, folder, name):
+        return name in self._folder(folder).files
+
+    def info(self, folder, name):
+        """Returns the FileInfo of a file, see Camera.file_info()."""
+        files = self._folder(folder).files
+        if name not in files:
+            raise KeyError(posixpath.join(_norm(folder), name))
+        if files[name] is None:
+            with self.camera.lock:
+                files[name] = self.camera.file_info(_norm(folder), name)
+            self.calls += 1
+        return files[name]
+
+    def walk(self, folder="/"):
+        """Yields (folder, name) of every file below folder."""
+        folder = _norm(folder)
+        entry = self._folder(folder)
+        for name in entry.files:
+            yield folder, name
+        for sub in entry.folders:
+            for item in self.walk(posixpath.join(folder, sub)):
+                yield item
+
+    def scan(self, folder="/", info=False):
+        """Loads everything below folder (and the file info too if info is
+        True) in one go, e.g. before going offline."""
+        for folder, name in self.walk(folder):
+            if info:
+                self.info(folder, name)
+
+    def glob(self, pattern):
+        """Returns the (folder, name) of the files matching pattern, an
+        absolute path with fnmatch wildcards in any component and ** for any
+        number of folders. Only folders that can match are listed."""
+        parts = [p for p in pattern.split("/") if p]
+        if not parts:
+            return []
+        return list(self._glob("/", parts[:-1], parts[-1]))
+
+    def _glob(self, folder, parts, filepat):
+        if not parts:
+            for name in self._folder(folder).files:
+                if fnmatch.fnmatchcase(name, filepat):
+                    yield folder, name
+            return
+        head, rest = parts[0], parts[1:]
+        if head == "**":
+            # zero folders here, or one more and still inside **
+            for item in self._glob(folder, rest, filepat):
+                yield item
+            for sub in self._folder(folder).folders:
+                for item in self._glob(posixpath.join(folder, sub), parts, filepat):
+                    yield item
+            return
+        for sub in self._folder(folder).folders:
+            if fnmatch.fnmatchcase(sub, head):
+                for item in self._glob(posixpath.join(folder, sub), rest, filepat):
+                    yield item
+
+    def add(self, folder, name):
+        """Records a new file, e.g. one just captured."""
+        folder = _norm(folder)
+        self._add_folder(folder)
+        entry = self._folders.get(folder)
+        if entry is not None:
+            entry.files[name] = None
+
+    def _add_folder(self, folder):
+        if folder == "/":
+            return
+        parent, name = posixpath.split(folder)
+        entry = self._folders.get(parent)
+        if entry is not None and name not in entry.folders:
+            entry.folders.append(name)
+        self._add_folder(parent)
+
+    def remove(self, folder, name):
+        entry = self._folders.get(_norm(folder))
+        if entry is not None:
+            entry.files.pop(name, None)
+
+    def invalidate(self, folder=None):
+        """Forgets folder (and what is below it), or everything."""
+        if folder is None:
+            self._folders.clear()
+            return
+        folder = _norm(folder)
+        prefix = folder.rstrip("/") + "/"
+        for f in list(self._folders):
+            if f == folder or f.startswith(prefix):
+                del self._folders[f]
+
+    def update(self, event):
+        """Applies a CameraEvent to the index."""
+        if event.type == GP_EVENT_FILE_ADDED:
+            self.add(event.folder, event.name)
+        elif event.type == GP_EVENT_FOLDER_ADDED:
+            self._add_folder(posixpath.join(_norm(event.folder), event.name))
+        elif event.type == GP_EVENT_FILE_CHANGED:
+            entry = self._folders.get(_norm(event.folder))
+            if entry is not None and event.name in entry.files:
+                entry.files[event.name] = None
@@ -0,0 +1,62 @@
+"""Focus bracketing: a series of shots, each with the focus moved a step
+further, for focus stacking.
+
+    frames = camera.focus_stack(50, step_size=2, destdir="stack")
+    for frame in frames:
+        print(frame.index, frame.position, frame.score, frame.path)
+
+Focus is moved with the live view focus drive (see piggyphoto.autofocus),
+each position is scored on a live view frame and the shots are downloaded
+by a CapturePipeline while the next ones are being taken.
+"""
+import os
+from collections import namedtuple
+
+from . import focus
+from .autofocus import FocusDrive, STEP_UNITS
+
+# position in focus drive units from the first frame; score is None when
+# scoring is off
+StackFrame = namedtuple('StackFrame', ['index', 'position', 'score', 'path'])
+
+
+def focus_stack(camera, n_steps, step_size=1, destdir=".", pattern="stack%03d.jpg",
+                metric='tenengrad', roi=None, score=True, queue_size=4,
+                setting="manualfocusdrive", step_units=STEP_UNITS, decoder=None):
+    """Takes n_steps shots, moving the focus by step_size units (negative
+    is towards the camera) between them. Returns the list of StackFrames
+    once every shot is on disk. The stack stops early, with fewer frames,
+    when the lens reaches the end of its travel: the shot at the end is
+    the last one.
+
+    score: rate every position with metric on a live view frame (see
+        piggyphoto.focus.measure(), also for roi and decoder); costs one
+        preview per shot.
+    """
+    drive = FocusDrive(camera, setting, step_units)
+    frames = camera.stream_previews()
+    shots = []
+    try:
+        with camera.pipeline(queue_size) as pipeline:
+            for index in range(n_steps):
+                if index:
+                    with camera.lock:
+                        moved = drive.move(step_size)
+                    if not moved:
+                        break
+                s = None
+                if score:
+                    with camera.lock:
+                        frame = next(frames)
+                    # decoding and scoring leave the camera to the downloads
+                    s = focus.measure(frame, (metric,), roi, decoder=decoder)[metric]
+                path = os.path.join(destdir, pattern % index)
+                shots.append((StackFrame(index, drive.position, s, path), pipeline.capture(path)))
+                if drive.limit:
+                    break
+    finally:
+        frames.close()
+    for frame, future in shots:
+        # raises the first download error, if any
+        future.result()
+    return [frame for frame, future in shots]
@@ -0,0 +1,183 @@
+"""Copying a whole card to disk.
+
+    result = camera.import_all("/srv/photos/card1", workers=2)
+    print(result.downloaded, result.skipped, result.bytes)
+
+Files keep the camera's folder layout below dest. The manifest of every file
+on the camera (folder, name, size, mtime) is written to dest before anything
+is downloaded. An interrupted import is resumed by running it again: files
+already on disk with the size from the manifest are skipped, and downloads
+only get their final name once complete.
+"""
+from __future__ import print_function
+import json
+import os
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from . import (libgphoto2error, _port_error, GP_ERROR_IO, GP_ERROR_TIMEOUT,
+               GP_ERROR_CORRUPTED_DATA, GP_ERROR_CAMERA_BUSY)
+
+MANIFEST = ".piggyphoto-manifest.json"
+
+# size and mtime are None where the camera does not report them
+ManifestEntry = namedtuple('ManifestEntry', ['folder', 'name', 'size', 'mtime'])
+# failed is a list of (ManifestEntry, exception)
+ImportResult = namedtuple('ImportResult', ['downloaded', 'skipped', 'failed', 'bytes'])
+
+
+def _transfer_error(e):
+    """Whether e is a libgphoto2error from the link to the camera (worth a
+    reconnect), rather than a missing file, a full disk and so on."""
+    if not isinstance(e, libgphoto2error):
+        return False
+    return (_port_error(e.result)
+            or e.result in (GP_ERROR_TIMEOUT, GP_ERROR_CORRUPTED_DATA, GP_ERROR_CAMERA_BUSY))
+
+
+def _makedirs(path):
+    try:
+        os.makedirs(path)
+    except OSError:
+        if not os.path.isdir(path):
+            raise
+
+
+class Importer(object):
+    def __init__(self, camera, dest, workers=1, progress=None, retries=3, rescan=True,
+                 direct_size=64 * 1024 * 1024):
+        """
+        workers: threads downloading at once. Transfers from one camera are
+            serialized on camera.lock; the workers overlap them with the disk
+            writes of files already received.
+        progress: called as progress(entry, done_bytes, total_bytes) after
+            each downloaded file.
+        retries: per file; after a transfer error (an I/O, USB or timeout
+            result from libgphoto2) the camera is reconnected
+            (Camera.reinit()) before trying again. Other errors, local disk
+            errors included, fail the file straight away.
+        rescan: walk the camera even if dest already holds a manifest.
+        direct_size: files at least this large are written to disk by
+            libgphoto2 directly (Camera.download_file(direct=True)) instead
+            of being held in memory.
+        """
+        self.camera = camera
+        self.dest = dest
+        self.workers = workers
+        self.progress = progress
+        self.retries = retries
+        self.rescan = rescan
+        self.direct_size = direct_size
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._done = 0
+        self._total = 0
+
+    @property
+    def manifest_path(self):
+        return os.path.join(self.dest, MANIFEST)
+
+    def path(self, entry):
+        """Where entry ends up on disk."""
+        return os.path.join(self.dest, entry.folder.lstrip("/"), entry.name)
+
+    def scan(self):
+        """Walks the camera through camera.fs and returns the list of
+        ManifestEntries. The index is refreshed first, as files shot or
+        deleted on the camera itself may not have been reported to it."""
+        fs = self.camera.fs
+        fs.invalidate()
+        entries = []
+        with self.camera.lock:
+            for folder, name in fs.walk():
+                try:
+                    info = fs.info(folder, name)
+                    entries.append(ManifestEntry(folder, name, info.size, info.mtime))
+                except libgphoto2error:
+                    entries.append(ManifestEntry(folder, name, None, None))
+        return entries
+
+    def load_manifest(self):
+        with open(self.manifest_path) as f:
+            return [ManifestEntry(*e) for e in json.load(f)['files']]
+
+    def save_manifest(self, entries):
+        _makedirs(self.dest)
+        tmp = self.manifest_path + ".part"
+        with open(tmp, 'w') as f:
+            json.dump({'model': self.camera.model, 'time': time.time(),
+                       'files': [list(e) for e in entries]}, f, indent=1)
+        os.rename(tmp, self.manifest_path)
+
+    def manifest(self):
+        if not self.rescan and os.path.exists(self.manifest_path):
+            return self.load_manifest()
+        entries = self.scan()
+        self.save_manifest(entries)
+        return entries
+
+    def is_done(self, entry):
+        path = self.path(entry)
+        if not os.path.exists(path):
+            return False
+        return entry.size is None or os.path.getsize(path) == entry.size
+
+    def run(self):
+        """Imports everything not on disk yet and returns an ImportResult."""
+        entries = self.manifest()
+        todo = [e for e in entries if not self.is_done(e)]
+        self._done = 0
+        self._total = sum(e.size or 0 for e in todo)
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = [(e, executor.submit(self._fetch, e)) for e in todo]
+        failed = [(e, f.exception()) for e, f in futures if f.exception() is not None]
+        return ImportResult(len(todo) - len(failed), len(entries) - len(todo), failed, self._done)
+
+    def _fetch(self, entry):
+        path = self.path(entry)
+        part = path + ".part"
+        _makedirs(os.path.dirname(path))
+        for attempt in range(self.retries + 1):
+            generation = self._generation
+            try:
+                self._download(entry, part)
+                break
+            except libgphoto2error as e:
+                if attempt == self.retries or not _transfer_error(e):
+                    raise
+                self._reconnect(generation)
+        os.rename(part, path)
+        if entry.mtime:
+            os.utime(path, (entry.mtime, entry.mtime))
+        with self._lock:
+            self._done += os.path.getsize(path)
+            if self.progress is not None:
+                self.progress(entry, self._done, self._total)
+
+    def _download(self, entry, part):
+        if entry.size is not None and entry.size >= self.direct_size:
+            with self.camera.lock:
+                self.camera.download_file(entry.folder, entry.name, part, direct=True)
+        else:
+            with self.camera.lock:
+                data = self.camera.get_file(entry.folder, entry.name).buffer()
+            with open(part, 'wb') as f:
+                f.write(data)
+        if entry.size is not None and os.path.getsize(part) != entry.size:
+            raise libgphoto2error(GP_ERROR_IO, "%s/%s: got %d of %d bytes" % (
+                entry.folder, entry.name, os.path.getsize(part), entry.size))
+
+    def _reconnect(self, generation):
+        # several workers may fail on the same disconnect; only the first
+        # one reconnects
+        with self.camera.lock:
+            if generation != self._generation:
+                return
+            self._generation += 1
+            try:
+                self.camera.reinit()
+            except libgphoto2error:
+                # still gone; the next attempt fails and reconnects again
+                time.sleep(1)
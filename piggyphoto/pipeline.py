@@ -0,0 +1,79 @@
+"""Pipelined capture: shots are triggered on the calling thread while a
+worker thread downloads the previous ones in the background.
+
+    with camera.pipeline(queue_size=4) as p:
+        shots = [p.capture("shot%03d.jpg" % i) for i in range(100)]
+    for shot in shots:
+        print(shot.result())
+"""
+import threading
+from concurrent.futures import Future
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+
+class CapturePipeline(object):
+    def __init__(self, camera, queue_size=4):
+        """queue_size bounds the number of shots waiting for download;
+        capture() blocks once that many are pending."""
+        self.camera = camera
+        self._queue = queue.Queue(queue_size)
+        self._closed = False
+        self._worker = threading.Thread(target=self._drain, name="piggyphoto-download")
+        self._worker.daemon = True
+        self._worker.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def capture(self, destpath):
+        """Captures an image and queues it for download to destpath.
+        Returns a Future whose result is destpath once the file is on disk.
+        Raises RuntimeError once the pipeline is closed, before shooting.
+        """
+        if self._closed:
+            raise RuntimeError("capture() on a closed CapturePipeline")
+        if not self._worker.is_alive():
+            raise RuntimeError("the download worker of this CapturePipeline has stopped")
+        with self.camera.lock:
+            folder, name = self.camera.capture_image()
+        future = Future()
+        self._queue.put((folder, name, destpath, future))
+        return future
+
+    @property
+    def pending(self):
+        return self._queue.qsize()
+
+    def close(self):
+        """Waits until all queued downloads are done and stops the worker."""
+        self._closed = True
+        if self._worker.is_alive():
+            self._queue.put(None)
+            self._worker.join()
+
+    def _drain(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            folder, name, destpath, future = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                # only the transfer needs the camera, the disk write overlaps
+                # with the next capture
+                with self.camera.lock:
+                    cfile = self.camera.get_file(folder, name)
+                cfile.save(destpath)
+                del cfile
+            except Exception as e:
+                future.set_exception(e)
+            else:
+                future.set_result(destpath)
@@ -0,0 +1,89 @@
+"""Driving several cameras at once.
+
+    pool = CameraPool()
+    for shot in pool.capture_all():
+        print(shot.port, shot.time, shot.folder, shot.name)
+    pool.close()
+
+Every camera gets its own GPContext and a worker thread, so all calls on a
+camera are serialized on that thread while the cameras run in parallel.
+"""
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from . import Camera, CameraList
+
+# time is the time.time() at which capture was requested on that camera
+Shot = namedtuple('Shot', ['port', 'model', 'time', 'folder', 'name'])
+
+
+class CameraPool(object):
+    def __init__(self, ports=None, backend=None, **kwargs):
+        """Opens every autodetected camera, or only those whose port is in
+        ports. Other keyword arguments are passed on to Camera()."""
+        self.cameras = []
+        self._workers = []
+        try:
+            for model, port in CameraList(autodetect=True, backend=backend).toList():
+                if ports is not None and port not in ports:
+                    continue
+                self.cameras.append(Camera(port=port, model=model, backend=backend, **kwargs))
+                self._workers.append(ThreadPoolExecutor(max_workers=1))
+        except Exception:
+            self.close()
+            raise
+
+    def __len__(self):
+        return len(self.cameras)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def submit(self, fn, *args, **kwargs):
+        """Runs fn(camera, *args, **kwargs) on every camera's worker thread.
+        Returns the list of futures, in the order of self.cameras."""
+        return [worker.submit(self._call, camera, fn, args, kwargs)
+                for camera, worker in zip(self.cameras, self._workers)]
+
+    def map(self, fn, *args, **kwargs):
+        """Like submit(), but waits and returns the results."""
+        return [f.result() for f in self.submit(fn, *args, **kwargs)]
+
+    def capture_all(self):
+        """Captures an image on every camera at the same time and returns a
+        list of Shots. The workers are all parked on one event before the
+        capture is fired, which keeps the trigger skew to thread wake-up time.
+        """
+        ready = threading.Semaphore(0)
+        go = threading.Event()
+
+        def capture(camera):
+            ready.release()
+            go.wait()
+            t = time.time()
+            folder, name = camera.capture_image()
+            return Shot(camera.port, camera.model, t, folder, name)
+
+        futures = self.submit(capture)
+        for f in futures:
+            ready.acquire()
+        go.set()
+        return [f.result() for f in futures]
+
+    def close(self):
+        for worker in self._workers:
+            worker.shutdown()
+        for camera in self.cameras:
+            camera.close()
+        self._workers = []
+        self.cameras = []
+
+    @staticmethod
+    def _call(camera, fn, args, kwargs):
+        with camera.lock:
+            return fn(camera, *args, **kwargs)
@@ -0,0 +1,1109 @@
+"""A simulated libgphoto2, for testing and benchmarking without a camera.
+
+SimulatedLibrary implements the gp_* functions piggyphoto calls, in pure
+Python and with the same calling conventions as the ctypes CDLL, so it can
+stand in for it:
+
+    # for the whole process, before importing piggyphoto
+    PIGGYPHOTO_BACKEND=sim python myscript.py
+
+    # or for one Camera
+    from piggyphoto.sim import SimulatedLibrary, SimulatedCamera
+    lib = SimulatedLibrary([SimulatedCamera(latency={'capture': 0.3})])
+    cam = piggyphoto.Camera(backend=lib)
+
+Each SimulatedCamera has a configuration tree, a file store, a live view
+frame generator, per-operation latencies and failure injection.
+"""
+import ctypes
+import io
+import itertools
+import os
+import random
+import threading
+import time
+from collections import deque, OrderedDict
+
+_clock = getattr(time, 'monotonic', time.time)
+
+# Values from gphoto2-port-result.h and gphoto2-result.h
+GP_OK = 0
+GP_ERROR = -1
+GP_ERROR_BAD_PARAMETERS = -2
+GP_ERROR_NOT_SUPPORTED = -6
+GP_ERROR_IO = -7
+GP_ERROR_TIMEOUT = -10
+GP_ERROR_IO_USB_FIND = -52
+GP_ERROR_IO_LOCK = -60
+GP_ERROR_MODEL_NOT_FOUND = -105
+GP_ERROR_DIRECTORY_NOT_FOUND = -107
+GP_ERROR_FILE_NOT_FOUND = -108
+GP_ERROR_CAMERA_BUSY = -110
+
+_messages = {
+    GP_OK: "No error",
+    GP_ERROR: "Unspecified error",
+    GP_ERROR_BAD_PARAMETERS: "Bad parameters",
+    GP_ERROR_NOT_SUPPORTED: "Unsupported operation",
+    GP_ERROR_IO: "I/O problem",
+    GP_ERROR_TIMEOUT: "Timeout reading from or writing to the port",
+    GP_ERROR_IO_USB_FIND: "Could not find the requested device on the USB port",
+    GP_ERROR_IO_LOCK: "Could not lock the device",
+    GP_ERROR_MODEL_NOT_FOUND: "Unknown model",
+    GP_ERROR_DIRECTORY_NOT_FOUND: "Directory not found",
+    GP_ERROR_FILE_NOT_FOUND: "File not found",
+    GP_ERROR_CAMERA_BUSY: "I/O in progress",
+}
+
+# Same values as in piggyphoto/__init__.py (gphoto2-widget.h, gphoto2-camera.h)
+GP_WIDGET_WINDOW = 0
+GP_WIDGET_SECTION = 1
+GP_WIDGET_TEXT = 2
+GP_WIDGET_RANGE = 3
+GP_WIDGET_TOGGLE = 4
+GP_WIDGET_RADIO = 5
+GP_WIDGET_MENU = 6
+GP_WIDGET_BUTTON = 7
+GP_WIDGET_DATE = 8
+
+GP_FILE_INFO_TYPE = 1 << 0
+GP_FILE_INFO_SIZE = 1 << 2
+GP_FILE_INFO_MTIME = 1 << 7
+
+GP_EVENT_UNKNOWN = 0
+GP_EVENT_TIMEOUT = 1
+GP_EVENT_FILE_ADDED = 2
+GP_EVENT_FOLDER_ADDED = 3
+GP_EVENT_CAPTURE_COMPLETE = 4
+
+# Seconds spent in each operation. download_rate is in bytes per second and
+# adds size / download_rate to the download latency (None: instantaneous).
+DEFAULT_LATENCY = {
+    'init': 0.0,
+    'config': 0.0,
+    'capture': 0.0,
+    'preview': 0.0,
+    'download': 0.0,
+    'download_rate': None,
+    'list': 0.0,
+}
+
+# focus drive steps of "Near 1".."Near 3" / "Far 1".."Far 3"
+FOCUS_STEPS = {1: 1, 2: 8, 3: 64}
+
+CAPTURE_FOLDER = "/store_00010001/DCIM/100CANON"
+
+# files created with gp_file_new_from_handler() receive downloads in chunks
+# of this size, like the PTP driver does
+DOWNLOAD_CHUNK = 1024 * 1024
+
+
+class Widget(object):
+    """A configuration widget. Describes the settings of a SimulatedCamera,
+    and is the object behind the gp_widget_* functions."""
+
+    def __init__(self, type, name, label=None, value=None, choices=(), range=None,
+                 children=(), readonly=False, info=""):
+        self.type = type
+        self.name = name
+        self.label = label if label is not None else name
+        self.info = info
+        self.value = value
+        self.choices = list(choices)
+        self.range = range
+        self.readonly = int(readonly)
+        self.changed = 0
+        self.id = 0
+        self.parent = None
+        self.children = []
+        self.refcount = 1
+        for c in children:
+            self.append(c)
+
+    def append(self, child):
+        child.parent = self
+        self.children.append(child)
+
+    def walk(self):
+        yield self
+        for c in self.children:
+            for w in c.walk():
+                yield w
+
+    def find(self, name):
+        """Returns the widget called name below this one, or None."""
+        for w in self.walk():
+            if w is not self and w.name == name:
+                return w
+        return None
+
+    def copy(self):
+        w = Widget(self.type, self.name, self.label, self.value, self.choices, self.range,
+                   [c.copy() for c in self.children], self.readonly, self.info)
+        w.id = self.id
+        return w
+
+
+def Section(name, label, *children):
+    return Widget(GP_WIDGET_SECTION, name, label, children=children)
+
+
+def default_config():
+    """A configuration tree shaped like the one of a Canon EOS body."""
+    iso = ["Auto", "100", "200", "400", "800", "1600", "3200", "6400"]
+    aperture = ["2.8", "3.2", "3.5", "4", "4.5", "5", "5.6", "6.3", "7.1", "8", "11", "16", "22"]
+    shutter = ["bulb", "30", "15", "8", "4", "2", "1", "1/2", "1/4", "1/8", "1/15", "1/30",
+               "1/60", "1/125", "1/250", "1/500", "1/1000", "1/2000", "1/4000"]
+    focus = ["Near 1", "Near 2", "Near 3", "None", "Far 1", "Far 2", "Far 3"]
+    window = Widget(GP_WIDGET_WINDOW, "main", "Camera and Driver Configuration", children=[
+        Section("actions", "Camera Actions",
+                Widget(GP_WIDGET_TOGGLE, "syncdatetime", "Synchronize camera date and time with PC", 0),
+                Widget(GP_WIDGET_TOGGLE, "autofocusdrive", "Drive Canon DSLR Autofocus", 0),
+                Widget(GP_WIDGET_RADIO, "manualfocusdrive", "Drive Canon DSLR Manual focus", "None", focus),
+                Widget(GP_WIDGET_TOGGLE, "bulb", "Bulb Mode", 0),
+                Widget(GP_WIDGET_TOGGLE, "viewfinder", "Canon EOS Viewfinder", 0)),
+        Section("settings", "Camera Settings",
+                Widget(GP_WIDGET_DATE, "datetime", "Camera Date and Time", int(time.time())),
+                Widget(GP_WIDGET_TEXT, "artist", "Artist", ""),
+                Widget(GP_WIDGET_RADIO, "capturetarget", "Capture Target", "Internal RAM",
+                       ["Internal RAM", "Memory card"])),
+        Section("status", "Camera Status Information",
+                Widget(GP_WIDGET_TEXT, "serialnumber", "Serial Number", "0000000001", readonly=True),
+                Widget(GP_WIDGET_TEXT, "batterylevel", "Battery Level", "100%", readonly=True)),
+        Section("imgsettings", "Image Settings",
+                Widget(GP_WIDGET_RADIO, "imageformat", "Image Format", "Large Fine JPEG",
+                       ["Large Fine JPEG", "RAW", "RAW + Large Fine JPEG"]),
+                Widget(GP_WIDGET_RADIO, "iso", "ISO Speed", "100", iso),
+                Widget(GP_WIDGET_RADIO, "whitebalance", "WhiteBalance", "Auto",
+                       ["Auto", "Daylight", "Shadow", "Cloudy", "Tungsten", "Fluorescent", "Flash"])),
+        Section("capturesettings", "Capture Settings",
+                Widget(GP_WIDGET_RADIO, "aperture", "Aperture", "5.6", aperture),
+                Widget(GP_WIDGET_RADIO, "shutterspeed", "Shutter Speed", "1/125", shutter),
+                Widget(GP_WIDGET_RANGE, "exposurecompensation2", "Exposure Compensation", 0.0,
+                       range=(-3.0, 3.0, 1.0 / 3))),
+    ])
+    for i, w in enumerate(window.walk()):
+        w.id = i
+    return window
+
+
+def jpeg_filler(size, seed=0):
+    """Returns size bytes framed like a JPEG (SOI ... EOI); not decodable."""
+    size = max(size, 4)
+    body = bytes(bytearray((seed + i) & 0xff for i in range(min(size - 4, 4096))))
+    body = (body * ((size - 4) // max(len(body), 1) + 1))[:size - 4]
+    return b"\xff\xd8" + body + b"\xff\xd9"
+
+
+class FocusPreview(object):
+    """A live view whose sharpness follows the focus drive, for exercising
+    autofocus code: pass SimulatedCamera(preview=FocusPreview()).
+
+    Frames are a fixed random texture blurred by |camera.focus - peak| /
+    depth pixels and encoded as JPEG, which needs PIL (and numpy).
+    """
+
+    def __init__(self, peak=620, depth=40.0, size=(320, 212), seed=0):
+        import numpy as np
+        from PIL import Image
+        self.peak = peak
+        self.depth = depth
+        texture = np.random.RandomState(seed).randint(0, 256, (size[1], size[0]))
+        self._texture = Image.fromarray(texture.astype(np.uint8))
+
+    def __call__(self, camera):
+        from PIL import ImageFilter
+        radius = abs(camera.focus - self.peak) / float(self.depth)
+        im = self._texture.filter(ImageFilter.GaussianBlur(radius)) if radius else self._texture
+        out = io.BytesIO()
+        im.save(out, "JPEG", quality=90)
+        return out.getvalue()
+
+
+class SimulatedCamera(object):
+    def __init__(self, model="Simulated Camera", port="usb:001,001", config=None, files=None,
+                 preview=None, preview_size=64 * 1024, capture_size=1024 * 1024,
+                 latency=None, failures=None, focus=500, focus_range=(0, 1000), seed=0):
+        """
+        config: a Widget tree, see default_config().
+        files: {folder: {name: bytes}} already on the card.
+        preview: callable(camera) returning the bytes of the next live view
+            frame; by default JPEG-framed filler of preview_size bytes.
+        latency: overrides DEFAULT_LATENCY.
+        failures: {operation: probability} of an operation failing with
+            GP_ERROR_IO, see also fail().
+        focus: position of the focus drive, moved by manualfocusdrive. A
+            step that would take it out of focus_range is refused with
+            GP_ERROR, leaving it where it was, as bodies report the end of
+            the lens travel.
+        """
+        self.model = model
+        self.port = port
+        self.config = config if config is not None else default_config()
+        # an empty card still has its root folder
+        self.files = OrderedDict([("/", OrderedDict())])
+        self.mtimes = {}
+        for folder, content in (files or {}).items():
+            for name, data in content.items():
+                self.add_file(folder, name, data)
+        self.preview = preview
+        self.preview_size = preview_size
+        self.capture_size = capture_size
+        self.latency = dict(DEFAULT_LATENCY, **(latency or {}))
+        self.failures = dict(failures or {})
+        self.focus = focus
+        self.focus_range = focus_range
+        self.frames = 0
+        self.shots = 0
+        self.events = deque()
+        self._scheduled = {}
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        # operations that started while another one was still running on
+        # this camera: a real camera over USB does not allow that
+        self.overlaps = 0
+        self._busy = threading.Lock()
+        # (op, start, end) of the latest operations, to tell whether operations
+        # on different cameras ran at the same time
+        self.timeline = deque(maxlen=1024)
+
+    def fail(self, operation, error=GP_ERROR_IO, times=1):
+        """Makes the next times calls of operation return error."""
+        self._scheduled.setdefault(operation, deque()).extend([error] * times)
+
+    def add_file(self, folder, name, data, mtime=None):
+        folder = folder.rstrip("/") or "/"
+        parent = folder
+        while parent != "/":
+            self.files.setdefault(parent, OrderedDict())
+            parent = parent.rsplit("/", 1)[0] or "/"
+        self.files[folder][name] = data
+        self.mtimes[folder, name] = int(mtime if mtime is not None else time.time())
+
+    def folders(self, folder):
+        folder = folder.rstrip("/") or "/"
+        prefix = folder if folder == "/" else folder + "/"
+        return [f[len(prefix):] for f in self.files
+                if f != folder and f.startswith(prefix) and "/" not in f[len(prefix):]]
+
+    def _operation(self, op, extra=0.0):
+        """Sleeps for the latency of op and returns GP_OK or an error code."""
+        delay = self.latency.get(op, 0.0) + extra
+        busy = not self._busy.acquire(False)
+        if busy:
+            with self._lock:
+                self.overlaps += 1
+        start = _clock()
+        try:
+            if delay:
+                time.sleep(delay)
+        finally:
+            if not busy:
+                self._busy.release()
+            self.timeline.append((op, start, _clock()))
+        scheduled = self._scheduled.get(op)
+        if scheduled:
+            return scheduled.popleft()
+        if self._rng.random() < self.failures.get(op, 0.0):
+            return GP_ERROR_IO
+        return GP_OK
+
+    def _download_time(self, size):
+        rate = self.latency.get('download_rate')
+        return float(size) / rate if rate else 0.0
+
+    def _set(self, widget, value):
+        if widget.readonly:
+            return GP_ERROR_BAD_PARAMETERS
+        if widget.type in (GP_WIDGET_RADIO, GP_WIDGET_MENU) and widget.choices \
+                and value not in widget.choices:
+            return GP_ERROR_BAD_PARAMETERS
+        if widget.name == "manualfocusdrive" and value != "None":
+            direction, step = value.split()
+            step = FOCUS_STEPS[int(step)] * (-1 if direction == "Near" else 1)
+            lower, upper = self.focus_range
+            if not lower <= self.focus + step <= upper:
+                return GP_ERROR
+            self.focus += step
+            return GP_OK
+        widget.value = value
+        return GP_OK
+
+    def apply(self, name, value):
+        w = self.config.find(name)
+        if w is None:
+            return GP_ERROR_BAD_PARAMETERS
+        with self._lock:
+            return self._set(w, value)
+
+    def turn(self, name, value):
+        """Changes a setting on the body, as turning a dial does, and reports
+        it the way the ptp2 driver does for Canon EOS bodies."""
+        w = self.config.find(name)
+        with self._lock:
+            w.value = value
+        self.events.append((GP_EVENT_UNKNOWN, 'PTP Property %04x changed, "%s" to "%s"'
+                            % (0xd100 + w.id, name, value)))
+
+    def next_frame(self):
+        self.frames += 1
+        if self.preview is not None:
+            return self.preview(self)
+        return jpeg_filler(self.preview_size, self.frames)
+
+    def capture(self):
+        with self._lock:
+            self.shots += 1
+            name = "IMG_%04d.JPG" % self.shots
+        self.add_file(CAPTURE_FOLDER, name, jpeg_filler(self.capture_size, self.shots))
+        return CAPTURE_FOLDER, name
+
+
+class _CameraFilePath(ctypes.Structure):
+    # same layout as piggyphoto.CameraFilePath
+    _fields_ = [('name', (ctypes.c_char * 128)),
+                ('folder', (ctypes.c_char * 1024))]
+
+
+class _Function(object):
+    """Stands in for a ctypes foreign function, so restype and argtypes can
+    be assigned as on a CDLL."""
+
+    def __init__(self, fn):
+        self._fn = fn
+        self.__name__ = fn.__name__
+        self.restype = None
+        self.argtypes = None
+
+    def __call__(self, *args):
+        return self._fn(*args)
+
+
+class _Handle(object):
+    refcount = 1
+
+
+class _Context(_Handle):
+    pass
+
+
+class _Camera(_Handle):
+    def __init__(self):
+        self.device = None
+        self.model = None
+        self.port = None
+
+
+class _File(_Handle):
+    def __init__(self, handler=None, priv=None, fd=None):
+        self.handler = handler
+        self.priv = priv
+        self.fd = fd
+        self.name = ""
+        self.mime_type = "application/octet-stream"
+        self.mtime = 0
+        self.set_data(b"")
+
+    def set_data(self, data):
+        self.size = len(data)
+        self.buf = (ctypes.c_ubyte * len(data)).from_buffer_copy(data) if data else None
+
+
+class _List(_Handle):
+    def __init__(self):
+        self.entries = []
+
+
+class _PortInfo(_Handle):
+    def __init__(self, path):
+        self.path = path
+
+
+def _out(arg):
+    """The object an output argument, byref(obj), points to."""
+    return getattr(arg, '_obj', arg)
+
+
+def _str(arg):
+    """Decodes a char* argument."""
+    if isinstance(arg, ctypes.c_char_p):
+        arg = arg.value
+    if not isinstance(arg, bytes):
+        # ctypes would pass a (unicode) str as a wchar_t*
+        raise TypeError("char* argument must be bytes, not %s" % type(arg).__name__)
+    return arg.decode("utf-8")
+
+
+def _value(arg):
+    if isinstance(arg, (int, float)):
+        return arg
+    return _out(arg).value
+
+
+def _poke(out, ctype, value):
+    # store value in the memory of the void* out, as C code casting it would
+    v = ctype(value)
+    ctypes.memmove(ctypes.addressof(out), ctypes.addressof(v), ctypes.sizeof(v))
+
+
+class SimulatedLibrary(object):
+    """Pure Python stand-in for the libgphoto2 CDLL, see the module docstring."""
+
+    version = b"2.5.31"
+
+    def __init__(self, cameras=None):
+        self.cameras = list(cameras) if cameras is not None else [SimulatedCamera()]
+        self._objects = {}
+        self._ids = itertools.count(0x1000)
+        # memory handed out as event data, until free() is called
+        self._allocated = {}
+        self._lock = threading.Lock()
+        for name in dir(type(self)):
+            if name.startswith('gp_'):
+                setattr(self, name, _Function(getattr(self, name)))
+
+    # handles
+
+    def _new(self, obj):
+        with self._lock:
+            handle = next(self._ids)
+            self._objects[handle] = obj
+        obj._handle = handle
+        return handle
+
+    def _handle(self, obj):
+        if getattr(obj, '_handle', None) not in self._objects:
+            self._new(obj)
+        return obj._handle
+
+    def _get(self, handle):
+        if not isinstance(handle, int):
+            handle = _out(handle).value
+        return self._objects[handle]
+
+    def _release(self, obj):
+        with self._lock:
+            for o in obj.walk() if isinstance(obj, Widget) else [obj]:
+                self._objects.pop(getattr(o, '_handle', None), None)
+        if getattr(obj, 'fd', None) is not None:
+            # gp_file_free() closes the descriptor of gp_file_new_from_fd()
+            os.close(obj.fd)
+            obj.fd = None
+
+    def _unref(self, handle):
+        obj = self._get(handle)
+        obj.refcount -= 1
+        if obj.refcount <= 0:
+            self._release(obj)
+        return GP_OK
+
+    def _ref(self, handle):
+        self._get(handle).refcount += 1
+        return GP_OK
+
+    def free(self, data):
+        """Frees event data returned by gp_camera_wait_for_event()."""
+        address = data.value if isinstance(data, ctypes.c_void_p) else data
+        self._allocated.pop(address, None)
+
+    def _allocate(self, obj):
+        address = ctypes.addressof(obj)
+        self._allocated[address] = obj
+        return address
+
+    # library
+
+    def gp_library_version(self, verbose):
+        return [self.version, b"simulated", None]
+
+    def gp_result_as_string(self, result):
+        return _messages.get(result, "Unknown error %d" % result).encode("utf-8")
+
+    def gp_context_new(self):
+        return self._new(_Context())
+
+    def gp_context_unref(self, context):
+        return self._unref(context)
+
+    # cameras
+
+    def gp_camera_autodetect(self, l, context):
+        l = self._get(l)
+        for device in self.cameras:
+            l.entries.append([device.model, device.port])
+        return len(self.cameras)
+
+    def gp_camera_new(self, out):
+        _out(out).value = self._new(_Camera())
+        return GP_OK
+
+    def gp_camera_ref(self, cam):
+        return self._ref(cam)
+
+    def gp_camera_unref(self, cam):
+        return self._unref(cam)
+
+    def gp_camera_free(self, cam):
+        self._release(self._get(cam))
+        return GP_OK
+
+    def gp_camera_set_abilities(self, cam, abilities):
+        self._get(cam).model = abilities.model.decode("utf-8")
+        return GP_OK
+
+    def gp_camera_set_port_info(self, cam, info):
+        self._get(cam).port = self._get(info).path
+        return GP_OK
+
+    def gp_camera_get_abilities(self, cam, out):
+        cam = self._get(cam)
+        self._fill_abilities(_out(out), cam.device.model if cam.device else cam.model or "")
+        return GP_OK
+
+    def gp_camera_init(self, cam, context):
+        cam = self._get(cam)
+        for device in self.cameras:
+            if cam.port is not None and device.port != cam.port:
+                continue
+            if cam.model is not None and device.model != cam.model:
+                continue
+            result = device._operation('init')
+            if result == GP_OK:
+                cam.device = device
+            return result
+        return GP_ERROR_MODEL_NOT_FOUND if cam.port is None else GP_ERROR_IO_USB_FIND
+
+    def gp_camera_exit(self, cam, context):
+        self._get(cam).device = None
+        return GP_OK
+
+    def _device(self, cam):
+        device = self._get(cam).device
+        if device is None:
+            raise ValueError("simulated camera used before gp_camera_init()")
+        return device
+
+    def _text(self, out, text):
+        _out(out).text = text.encode("utf-8")[:32 * 1024 - 1]
+        return GP_OK
+
+    def gp_camera_get_summary(self, cam, out, context):
+        device = self._device(cam)
+        return self._text(out, "Model: %s\nPort: %s\nShots: %d\n" % (device.model, device.port, device.shots))
+
+    def gp_camera_get_manual(self, cam, out, context):
+        return self._text(out, "Simulated camera, see piggyphoto.sim.\n")
+
+    def gp_camera_get_about(self, cam, out, context):
+        return self._text(out, "piggyphoto simulated libgphoto2 backend.\n")
+
+    def gp_camera_get_config(self, cam, out, context):
+        device = self._device(cam)
+        result = device._operation('config')
+        if result == GP_OK:
+            with device._lock:
+                window = device.config.copy()
+            _out(out).value = self._new(window)
+        return result
+
+    def gp_camera_set_config(self, cam, window, context):
+        device = self._device(cam)
+        result = device._operation('config')
+        if result != GP_OK:
+            return result
+        for w in self._get(window).walk():
+            if w.changed and w.type not in (GP_WIDGET_WINDOW, GP_WIDGET_SECTION):
+                w.changed = 0
+                result = device.apply(w.name, w.value)
+                if result != GP_OK:
+                    return result
+        return GP_OK
+
+    def gp_camera_get_single_config(self, cam, name, out, context):
+        device = self._device(cam)
+        result = device._operation('config')
+        if result != GP_OK:
+            return result
+        w = device.config.find(_str(name))
+        if w is None:
+            return GP_ERROR_BAD_PARAMETERS
+        with device._lock:
+            _out(out).value = self._new(w.copy())
+        return GP_OK
+
+    def gp_camera_set_single_config(self, cam, name, widget, context):
+        device = self._device(cam)
+        result = device._operation('config')
+        if result != GP_OK:
+            return result
+        w = self._get(widget)
+        w.changed = 0
+        return device.apply(_str(name), w.value)
+
+    def gp_camera_capture(self, cam, type, out, context):
+        device = self._device(cam)
+        result = device._operation('capture')
+        if result == GP_OK:
+            folder, name = device.capture()
+            path = _out(out)
+            path.folder = folder.encode("utf-8")
+            path.name = name.encode("utf-8")
+        return result
+
+    def gp_camera_trigger_capture(self, cam, context):
+        device = self._device(cam)
+        result = device._operation('capture')
+        if result == GP_OK:
+            folder, name = device.capture()
+            device.events.append((GP_EVENT_FILE_ADDED, (folder, name)))
+            device.events.append((GP_EVENT_CAPTURE_COMPLETE, None))
+        return result
+
+    def gp_camera_capture_preview(self, cam, cf, context):
+        device = self._device(cam)
+        result = device._operation('preview')
+        if result == GP_OK:
+            f = self._get(cf)
+            f.set_data(device.next_frame())
+            f.name = "capture_preview.jpg"
+            f.mime_type = "image/jpeg"
+        return result
+
+    def gp_camera_wait_for_event(self, cam, timeout, evtype, data, context):
+        device = self._device(cam)
+        deadline = time.time() + timeout / 1000.0
+        while not device.events and time.time() < deadline:
+            time.sleep(min(0.01, timeout / 1000.0))
+        if not device.events:
+            _out(evtype).value = GP_EVENT_TIMEOUT
+            _out(data).value = None
+            return GP_OK
+        type, payload = device.events.popleft()
+        _out(evtype).value = type
+        if type in (GP_EVENT_FILE_ADDED, GP_EVENT_FOLDER_ADDED):
+            path = _CameraFilePath()
+            path.folder = payload[0].encode("utf-8")
+            path.name = payload[1].encode("utf-8")
+            _out(data).value = self._allocate(path)
+        elif type == GP_EVENT_UNKNOWN:
+            _out(data).value = self._allocate(ctypes.create_string_buffer(payload.encode("utf-8")))
+        else:
+            _out(data).value = None
+        return GP_OK
+
+    def gp_camera_folder_list_files(self, cam, folder, l, context):
+        device = self._device(cam)
+        result = device._operation('list')
+        folder = _str(folder).rstrip("/") or "/"
+        if result == GP_OK:
+            if folder not in device.files:
+                return GP_ERROR_DIRECTORY_NOT_FOUND
+            self._get(l).entries.extend([name, None] for name in device.files[folder])
+        return result
+
+    def gp_camera_folder_list_folders(self, cam, folder, l, context):
+        device = self._device(cam)
+        result = device._operation('list')
+        folder = _str(folder).rstrip("/") or "/"
+        if result == GP_OK:
+            if folder not in device.files:
+                return GP_ERROR_DIRECTORY_NOT_FOUND
+            self._get(l).entries.extend([name, None] for name in device.folders(folder))
+        return result
+
+    def _lookup(self, device, folder, name):
+        folder = _str(folder).rstrip("/") or "/"
+        return device.files.get(folder, {}).get(_str(name))
+
+    def gp_camera_file_get(self, cam, folder, name, type, cf, context):
+        device = self._device(cam)
+        data = self._lookup(device, folder, name)
+        if data is None:
+            return GP_ERROR_FILE_NOT_FOUND
+        result = device._operation('download', device._download_time(len(data)))
+        if result == GP_OK:
+            f = self._get(cf)
+            if f.handler is not None:
+                result = self._write_handler(f, data)
+            elif f.fd is not None:
+                view = memoryview(data)
+                while len(view):
+                    view = view[os.write(f.fd, view):]
+            else:
+                f.set_data(data)
+            f.name = _str(name)
+            f.mime_type = "image/jpeg"
+        return result
+
+    # files
+
+    def gp_file_new(self, out):
+        _out(out).value = self._new(_File())
+        return GP_OK
+
+    def gp_camera_file_get_info(self, cam, folder, name, info, context):
+        device = self._device(cam)
+        data = self._lookup(device, folder, name)
+        if data is None:
+            return GP_ERROR_FILE_NOT_FOUND
+        result = device._operation('list')
+        if result == GP_OK:
+            f = _out(info).file
+            f.fields = GP_FILE_INFO_TYPE | GP_FILE_INFO_SIZE | GP_FILE_INFO_MTIME
+            f.type = b"image/jpeg"
+            f.size = len(data)
+            f.mtime = device.mtimes[_str(folder).rstrip("/") or "/", _str(name)]
+        return result
+
+    def gp_file_new_from_fd(self, out, fd):
+        _out(out).value = self._new(_File(fd=fd))
+        return GP_OK
+
+    def gp_file_new_from_handler(self, out, handler, priv):
+        _out(out).value = self._new(_File(_out(handler), priv))
+        return GP_OK
+
+    def _write_handler(self, f, data):
+        for i in range(0, len(data), DOWNLOAD_CHUNK):
+            chunk = data[i:i + DOWNLOAD_CHUNK]
+            buf = (ctypes.c_ubyte * len(chunk)).from_buffer_copy(chunk)
+            length = ctypes.c_uint64(len(chunk))
+            result = f.handler.write(f.priv, ctypes.cast(buf, ctypes.POINTER(ctypes.c_ubyte)),
+                                     ctypes.byref(length))
+            if result != GP_OK:
+                return result
+        return GP_OK
+
+    def gp_file_ref(self, cf):
+        return self._ref(cf)
+
+    def gp_file_unref(self, cf):
+        return self._unref(cf)
+
+    def gp_file_free(self, cf):
+        self._release(self._get(cf))
+        return GP_OK
+
+    def gp_file_clean(self, cf):
+        self._get(cf).set_data(b"")
+        return GP_OK
+
+    def gp_file_copy(self, dest, source):
+        dest, source = self._get(dest), self._get(source)
+        dest.set_data(bytes(bytearray(source.buf)) if source.buf else b"")
+        dest.name, dest.mime_type = source.name, source.mime_type
+        return GP_OK
+
+    def gp_file_open(self, cf, filename):
+        with open(_str(filename), 'rb') as f:
+            self._get(cf).set_data(f.read())
+        return GP_OK
+
+    def gp_file_get_data_and_size(self, cf, data, size):
+        f = self._get(cf)
+        _out(data).value = ctypes.addressof(f.buf) if f.buf is not None else None
+        _out(size).value = f.size
+        return GP_OK
+
+    def gp_file_get_name(self, cf, out):
+        _out(out).value = self._get(cf).name.encode("utf-8")
+        return GP_OK
+
+    def gp_file_set_name(self, cf, name):
+        self._get(cf).name = _str(name)
+        return GP_OK
+
+    def gp_file_get_mime_type(self, cf, out):
+        _out(out).value = self._get(cf).mime_type.encode("utf-8")
+        return GP_OK
+
+    # lists
+
+    def gp_list_new(self, out):
+        _out(out).value = self._new(_List())
+        return GP_OK
+
+    def gp_list_ref(self, l):
+        return self._ref(l)
+
+    def gp_list_unref(self, l):
+        return self._unref(l)
+
+    def gp_list_free(self, l):
+        self._release(self._get(l))
+        return GP_OK
+
+    def gp_list_reset(self, l):
+        self._get(l).entries = []
+        return GP_OK
+
+    def gp_list_append(self, l, name, value):
+        self._get(l).entries.append([_str(name), _str(value) if value is not None else None])
+        return GP_OK
+
+    def gp_list_sort(self, l):
+        self._get(l).entries.sort(key=lambda e: e[0])
+        return GP_OK
+
+    def gp_list_count(self, l):
+        return len(self._get(l).entries)
+
+    def gp_list_find_by_name(self, l, out, name):
+        name = _str(name)
+        for i, entry in enumerate(self._get(l).entries):
+            if entry[0] == name:
+                _out(out).value = i
+                return GP_OK
+        return GP_ERROR
+
+    def _entry(self, l, index, field, out):
+        entries = self._get(l).entries
+        if not 0 <= index < len(entries):
+            return GP_ERROR_BAD_PARAMETERS
+        s = entries[index][field]
+        _out(out).value = s.encode("utf-8") if s is not None else None
+        return GP_OK
+
+    def gp_list_get_name(self, l, index, out):
+        return self._entry(l, index, 0, out)
+
+    def gp_list_get_value(self, l, index, out):
+        return self._entry(l, index, 1, out)
+
+    def gp_list_set_name(self, l, index, name):
+        self._get(l).entries[index][0] = _str(name)
+        return GP_OK
+
+    def gp_list_set_value(self, l, index, value):
+        self._get(l).entries[index][1] = _str(value)
+        return GP_OK
+
+    # abilities and ports
+
+    def _fill_abilities(self, ab, model):
+        ab.model = model.encode("utf-8")
+        ab.status = 0
+        ab.port = 2  # GP_PORT_USB
+        ab.operations = 0x1 | 0x4 | 0x10  # capture image, preview, config
+        ab.file_operations = 0x1 | 0x2
+        ab.folder_operations = 0
+        ab.usb_vendor = 0x04a9
+        ab.usb_product = 0x3199
+        ab.library = b"sim"
+        ab.id = b"sim"
+
+    def gp_abilities_list_new(self, out):
+        _out(out).value = self._new(_List())
+        return GP_OK
+
+    def gp_abilities_list_load(self, l, context):
+        models = []
+        for device in self.cameras:
+            if device.model not in models:
+                models.append(device.model)
+        self._get(l).entries = [[m, None] for m in models]
+        return GP_OK
+
+    def gp_abilities_list_free(self, l):
+        self._release(self._get(l))
+        return GP_OK
+
+    def gp_abilities_list_lookup_model(self, l, model):
+        model = _str(model)
+        for i, entry in enumerate(self._get(l).entries):
+            if entry[0] == model:
+                return i
+        return GP_ERROR_MODEL_NOT_FOUND
+
+    def gp_abilities_list_get_abilities(self, l, index, out):
+        self._fill_abilities(_out(out), self._get(l).entries[index][0])
+        return GP_OK
+
+    def gp_abilities_list_detect(self, l, il, out, context):
+        return self.gp_camera_autodetect(out, context)
+
+    def gp_port_info_list_new(self, out):
+        _out(out).value = self._new(_List())
+        return GP_OK
+
+    def gp_port_info_list_load(self, l):
+        self._get(l).entries = [[d.port, None] for d in self.cameras]
+        return GP_OK
+
+    def gp_port_info_list_free(self, l):
+        self._release(self._get(l))
+        return GP_OK
+
+    def gp_port_info_list_count(self, l):
+        return len(self._get(l).entries)
+
+    def gp_port_info_list_lookup_path(self, l, path):
+        path = _str(path)
+        for i, entry in enumerate(self._get(l).entries):
+            if entry[0] == path:
+                return i
+        return GP_ERROR_IO_USB_FIND
+
+    def gp_port_info_list_get_info(self, l, index, out):
+        _out(out).value = self._new(_PortInfo(self._get(l).entries[index][0]))
+        return GP_OK
+
+    # widgets
+
+    def gp_widget_new(self, type, label, out):
+        _out(out).value = self._new(Widget(type, "", _str(label)))
+        return GP_OK
+
+    def gp_widget_ref(self, w):
+        return self._ref(w)
+
+    def gp_widget_unref(self, w):
+        return self._unref(w)
+
+    def gp_widget_free(self, w):
+        self._release(self._get(w))
+        return GP_OK
+
+    def _get_string(self, w, attr, out):
+        _out(out).value = getattr(self._get(w), attr).encode("utf-8")
+        return GP_OK
+
+    def _set_attr(self, w, attr, value):
+        setattr(self._get(w), attr, value)
+        return GP_OK
+
+    def gp_widget_get_name(self, w, out):
+        return self._get_string(w, 'name', out)
+
+    def gp_widget_set_name(self, w, name):
+        return self._set_attr(w, 'name', _str(name))
+
+    def gp_widget_get_label(self, w, out):
+        return self._get_string(w, 'label', out)
+
+    def gp_widget_set_label(self, w, label):
+        return self._set_attr(w, 'label', _str(label))
+
+    def gp_widget_get_info(self, w, out):
+        return self._get_string(w, 'info', out)
+
+    def gp_widget_set_info(self, w, info):
+        return self._set_attr(w, 'info', _str(info))
+
+    def gp_widget_get_id(self, w, out):
+        _out(out).value = self._get(w).id
+        return GP_OK
+
+    def gp_widget_get_type(self, w, out):
+        _out(out).value = self._get(w).type
+        return GP_OK
+
+    def gp_widget_get_readonly(self, w, out):
+        _out(out).value = self._get(w).readonly
+        return GP_OK
+
+    def gp_widget_set_readonly(self, w, readonly):
+        return self._set_attr(w, 'readonly', int(readonly))
+
+    def gp_widget_changed(self, w):
+        w = self._get(w)
+        changed, w.changed = w.changed, 0
+        return changed
+
+    def gp_widget_set_changed(self, w, changed):
+        return self._set_attr(w, 'changed', int(changed))
+
+    def gp_widget_get_value(self, w, out):
+        w = self._get(w)
+        out = _out(out)
+        if w.type in (GP_WIDGET_TEXT, GP_WIDGET_RADIO, GP_WIDGET_MENU):
+            w._cvalue = ctypes.create_string_buffer((w.value or "").encode("utf-8"))
+            out.value = ctypes.addressof(w._cvalue)
+        elif w.type == GP_WIDGET_RANGE:
+            _poke(out, ctypes.c_float, w.value)
+        elif w.type in (GP_WIDGET_TOGGLE, GP_WIDGET_DATE):
+            _poke(out, ctypes.c_int, w.value)
+        else:
+            return GP_ERROR_BAD_PARAMETERS
+        return GP_OK
+
+    def gp_widget_set_value(self, w, value):
+        w = self._get(w)
+        if w.type in (GP_WIDGET_TEXT, GP_WIDGET_RADIO, GP_WIDGET_MENU):
+            value = _str(value)
+        elif w.type in (GP_WIDGET_RANGE, GP_WIDGET_TOGGLE, GP_WIDGET_DATE):
+            value = _value(value)
+        else:
+            return GP_ERROR_BAD_PARAMETERS
+        if value != w.value:
+            w.value = value
+            w.changed = 1
+        return GP_OK
+
+    def gp_widget_get_range(self, w, lower, upper, step):
+        w = self._get(w)
+        if w.type != GP_WIDGET_RANGE:
+            return GP_ERROR_BAD_PARAMETERS
+        _out(lower).value, _out(upper).value, _out(step).value = w.range
+        return GP_OK
+
+    def gp_widget_set_range(self, w, lower, upper, step):
+        return self._set_attr(w, 'range', (_value(lower), _value(upper), _value(step)))
+
+    def gp_widget_add_choice(self, w, choice):
+        self._get(w).choices.append(_str(choice))
+        return GP_OK
+
+    def gp_widget_count_choices(self, w):
+        return len(self._get(w).choices)
+
+    def gp_widget_get_choice(self, w, index, out):
+        choices = self._get(w).choices
+        if not 0 <= index < len(choices):
+            return GP_ERROR_BAD_PARAMETERS
+        _out(out).value = choices[index].encode("utf-8")
+        return GP_OK
+
+    def gp_widget_append(self, w, child):
+        self._get(w).append(self._get(child))
+        return GP_OK
+
+    def gp_widget_prepend(self, w, child):
+        w, child = self._get(w), self._get(child)
+        child.parent = w
+        w.children.insert(0, child)
+        return GP_OK
+
+    def gp_widget_count_children(self, w):
+        return len(self._get(w).children)
+
+    def _widget_out(self, widget, out):
+        if widget is None:
+            return GP_ERROR_BAD_PARAMETERS
+        _out(out).value = self._handle(widget)
+        return GP_OK
+
+    def gp_widget_get_child(self, w, index, out):
+        children = self._get(w).children
+        return self._widget_out(children[index] if 0 <= index < len(children) else None, out)
+
+    def gp_widget_get_child_by_name(self, w, name, out):
+        return self._widget_out(self._get(w).find(_str(name)), out)
+
+    def gp_widget_get_child_by_label(self, w, label, out):
+        label = _str(label)
+        found = [c for c in self._get(w).walk() if c.label == label]
+        return self._widget_out(found[0] if found else None, out)
+
+    def gp_widget_get_child_by_id(self, w, id, out):
+        found = [c for c in self._get(w).walk() if c.id == id]
+        return self._widget_out(found[0] if found else None, out)
+
+    def gp_widget_get_parent(self, w, out):
+        return self._widget_out(self._get(w).parent, out)
+
+    def gp_widget_get_root(self, w, out):
+        w = self._get(w)
+        while w.parent is not None:
+            w = w.parent
+        return self._widget_out(w, out)
@@ -0,0 +1,114 @@
+"""Immutable, plain Python copies of a camera configuration tree.
+
+Reading a CameraWidget property is a ctypes call every time; a snapshot reads
+the tree once so it can be inspected, logged or compared cheaply.
+"""
+import json
+from collections import namedtuple, OrderedDict
+from time import time as _now
+
+# type is one of the GP_WIDGET_* constants, range is (min, max, increment)
+# for range widgets and choices the options of menu and radio widgets.
+WidgetSnapshot = namedtuple('WidgetSnapshot',
+    ['path', 'name', 'label', 'type', 'value', 'range', 'choices', 'readonly'])
+
+
+class ConfigSnapshot(object):
+    """The settings of a camera at one point in time.
+
+    Settings can be looked up by path (snap["main.imgsettings.iso"]), by
+    name (snap["iso"]) or as attributes (snap.iso); iterating yields the
+    WidgetSnapshots in tree order. A setting named like a method or like
+    time is hidden by it as an attribute, snap["name"] always finds it.
+    Snapshots cannot be changed, updated() returns a changed copy.
+    """
+    __slots__ = ('_widgets', '_names', '_time')
+
+    def __init__(self, widgets, time=None):
+        object.__setattr__(self, '_widgets', OrderedDict((w.path, w) for w in widgets))
+        object.__setattr__(self, '_names', dict((w.name, w) for w in widgets))
+        object.__setattr__(self, '_time', _now() if time is None else time)
+
+    @property
+    def time(self):
+        """When the snapshot was taken, as returned by time.time()."""
+        return self._time
+
+    def __setattr__(self, name, value):
+        raise AttributeError("ConfigSnapshot is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError("ConfigSnapshot is immutable")
+
+    def __len__(self):
+        return len(self._widgets)
+
+    def __iter__(self):
+        return iter(self._widgets.values())
+
+    def __contains__(self, key):
+        return key in self._widgets or key in self._names
+
+    def __getitem__(self, key):
+        try:
+            return self._widgets[key]
+        except KeyError:
+            return self._names[key]
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        try:
+            return self._names[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __eq__(self, other):
+        return isinstance(other, ConfigSnapshot) and self._widgets == other._widgets
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return "<ConfigSnapshot of %d settings at %s>" % (len(self), self.time)
+
+    def values(self):
+        """Returns a {path: value} dict."""
+        return dict((path, w.value) for path, w in self._widgets.items())
+
+    def updated(self, values):
+        """Returns a snapshot taken now, with the {path: value} values changed."""
+        return ConfigSnapshot([w._replace(value=values[w.path]) if w.path in values else w
+                               for w in self])
+
+    def diff(self, other):
+        """Returns {path: (value here, value in other)} for every setting whose
+        value differs; settings missing on one side have None there."""
+        changes = {}
+        for path, w in self._widgets.items():
+            o = other._widgets.get(path)
+            if o is None:
+                changes[path] = (w.value, None)
+            elif o.value != w.value:
+                changes[path] = (w.value, o.value)
+        for path, o in other._widgets.items():
+            if path not in self._widgets:
+                changes[path] = (None, o.value)
+        return changes
+
+    def to_json(self, **kwargs):
+        return json.dumps({
+            'time': self.time,
+            'widgets': [w._asdict() for w in self],
+        }, **kwargs)
+
+    @classmethod
+    def from_json(cls, text):
+        data = json.loads(text)
+        widgets = []
+        for w in data['widgets']:
+            w['range'] = tuple(w['range']) if w['range'] is not None else None
+            w['choices'] = tuple(w['choices'])
+            widgets.append(WidgetSnapshot(**w))
+        return cls(widgets, data['time'])
+
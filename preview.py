@@ -1,6 +1,10 @@
 import piggyphoto, pygame
-import os
-import time
+import io
+import sys
+
+# python preview.py [SCALE]: with SCALE 2, 4 or 8 frames are decoded at that
+# fraction of their size (piggyphoto.jpeg, needs PIL), which is much cheaper
+scale = int(sys.argv[1]) if len(sys.argv) > 1 else 1
 
 def quit_pressed():
     for event in pygame.event.get():
@@ -8,22 +12,26 @@ def quit_pressed():
             return True
     return False
 
-def show(file):
-    picture = pygame.image.load(file)
-    main_surface.blit(picture, (0, 0))
+def load(frame):
+    if scale == 1:
+        return pygame.image.load(io.BytesIO(frame), "preview.jpg")
+    from piggyphoto import jpeg
+    im = jpeg.load(frame, "RGB", scale)
+    return pygame.image.frombuffer(im.tobytes(), im.size, "RGB")
+
+def show(frame):
+    main_surface.blit(load(frame), (0, 0))
     pygame.display.flip()
 
 C = piggyphoto.Camera()
 C.leave_locked()
-cfile = C.capture_preview('preview.jpg')
-cfile.clean()
+frames = C.stream_previews()
 
-picture = pygame.image.load("preview.jpg")
+picture = load(next(frames))
 pygame.display.set_mode(picture.get_size())
 main_surface = pygame.display.get_surface()
 
-while not quit_pressed():
-    cfile = C.capture_preview('preview.jpg')
-    cfile.clean()
-    show("preview.jpg")
-
+for frame in frames:
+    if quit_pressed():
+        break
+    show(frame)
@@ -6,17 +6,11 @@ print(C.abilities)
 
 
 # example: setting date manually
-cc = C.config
-dt = cc.get_child_by_name("datetime")
-print(dt.value)
-dt.value = 1400000000
-C.config = cc
-print(dt.value)
+print(C.get_setting("datetime"))
+C.set_setting("datetime", 1400000000)
+print(C.get_setting("datetime"))
 
 # example: date autosync
-cc = C.config
-syncdate = cc.get_child_by_name("syncdatetime")
-syncdate.value = 1
-C.config = cc
+C.set_setting("syncdatetime", 1)
 
 C.close()
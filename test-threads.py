@@ -0,0 +1,81 @@
+from __future__ import print_function
+import threading
+import time
+import piggyphoto
+from piggyphoto.pool import CameraPool
+from piggyphoto.sim import SimulatedLibrary, SimulatedCamera
+
+# Checks the threading rules of piggyphoto on simulated cameras, which count
+# operations that overlap on one camera and record when each one ran:
+#   python test-threads.py
+LATENCY = {'preview': 0.002, 'config': 0.001, 'capture': 0.003, 'download': 0.002}
+THREADS = 8
+ROUNDS = 10
+
+
+def work(camera, errors, locked=True):
+    try:
+        for i in range(ROUNDS):
+            for op in (lambda: camera.capture_preview(),
+                       lambda: camera.set_setting("iso", "400"),
+                       lambda: camera.get_setting("iso"),
+                       lambda: camera.get_file(*camera.capture_image()).buffer()):
+                if locked:
+                    with camera.lock:
+                        op()
+                else:
+                    op()
+    except Exception as e:
+        errors.append(e)
+
+
+def run(targets):
+    errors = []
+    threads = [threading.Thread(target=work, args=(cam, errors, locked)) for cam, locked in targets]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return errors
+
+
+def concurrent(a, b):
+    """Whether an operation on device a ran at the same time as one on b."""
+    return any(s1 < e2 and s2 < e1 for _, s1, e1 in a.timeline for _, s2, e2 in b.timeline)
+
+# N threads sharing one Camera through Camera.lock: no overlaps, no errors
+device = SimulatedCamera(latency=LATENCY)
+cam = piggyphoto.Camera(backend=SimulatedLibrary([device]))
+errors = run([(cam, True)] * THREADS)
+assert not errors, errors
+assert device.overlaps == 0, device.overlaps
+assert device.shots == THREADS * ROUNDS
+cam.close()
+
+# the same without the lock does overlap, so the check above means something
+device = SimulatedCamera(latency=LATENCY)
+cam = piggyphoto.Camera(backend=SimulatedLibrary([device]))
+run([(cam, False)] * THREADS)
+assert device.overlaps > 0
+cam.close()
+
+# one thread per camera: no overlaps, and the cameras run in parallel
+devices = [SimulatedCamera(port="usb:001,%03d" % (i + 1), latency=LATENCY) for i in range(4)]
+library = SimulatedLibrary(devices)
+with CameraPool(backend=library) as pool:
+    contexts = set(c._context.value for c in pool.cameras)
+    assert len(contexts) == len(devices)
+    for d in devices:
+        d.timeline.clear()
+    t = time.time()
+    errors = run([(c, True) for c in pool.cameras])
+    parallel = time.time() - t
+# closing the pool releases the cameras' contexts
+assert not contexts & set(library._objects), contexts
+assert not errors, errors
+assert sum(d.overlaps for d in devices) == 0
+# every camera ran operations while another camera was busy; wall-clock times
+# are not compared, the simulated latencies are too short for that
+for d in devices:
+    assert any(concurrent(d, o) for o in devices if o is not d), d.port
+print("ok: %d cameras in %.2fs" % (len(devices), parallel))
@@ -0,0 +1,13 @@
+from __future__ import print_function
+import piggyphoto as pp
+
+C = pp.Camera()
+print(C.abilities)
+
+# download every shot the moment the camera reports it
+for event in C.events():
+    print(event)
+    if event.type == pp.GP_EVENT_FILE_ADDED:
+        C.download_file(event.folder, event.name, event.name)
+
+C.close()
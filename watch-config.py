@@ -0,0 +1,13 @@
+from __future__ import print_function
+import piggyphoto
+
+C = piggyphoto.Camera()
+print(C.abilities)
+
+# prints every setting as it changes, e.g. when a dial is turned; the clock
+# (piggyphoto.VOLATILE_SETTINGS) is left out
+for changes, snapshot in C.watch_config(interval=0.5):
+    for path, (old, new) in sorted(changes.items()):
+        print("%-40s %s -> %s" % (path, old, new))
+
+C.close()